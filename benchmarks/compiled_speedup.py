@@ -0,0 +1,84 @@
+import argparse
+import os
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import BACKENDS, Calculate  # noqa: E402
+
+
+# Expressions in x; 'raw' is the same arithmetic written as a Python lambda
+EXPRESSIONS = {
+    "short": ("x*2+1", lambda x: x * 2.0 + 1.0),
+    "poly": (
+        "3*x^3-2*x^2+x/7-5",
+        lambda x: 3.0 * x**3.0 - 2.0 * x**2.0 + x / 7.0 - 5.0,
+    ),
+    "constants": (
+        "x*(2^10)/(3*4)+(1+2+3)*(4-1)",
+        lambda x: x * 1024.0 / 12.0 + 18.0,
+    ),
+    "long": (
+        "+".join(f"{i}*x" for i in range(1, 101)),
+        eval("lambda x: " + "+".join(f"{i}.0*x" for i in range(1, 101))),
+    ),
+}
+
+
+def per_call(func, repeat):
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    return min(timer.repeat(repeat, number)) / number
+
+
+def run(backend, repeat, value):
+    calc_engine = Calculate(backend=backend)
+    number = calc_engine.coerce(value)
+    rows = []
+    for name, (expr, raw) in EXPRESSIONS.items():
+        compiled = calc_engine.compile(expr, ("x",))
+        # The interpreter has no variables, so it runs the program with the
+        # value already substituted; parsing is not timed for either tier
+        program = calc_engine.parse(expr.replace("x", f"({value!r})"))
+        interpreted = per_call(lambda: calc_engine.evaluate(program), repeat)
+        fast = per_call(lambda: compiled(number), repeat)
+        row = {
+            "name": name,
+            "interpreted": interpreted,
+            "compiled": fast,
+            "compile": per_call(lambda: calc_engine.compile(expr, ("x",)), 1),
+        }
+        if backend == "float":
+            row["raw"] = per_call(lambda: raw(value), repeat)
+        rows.append(row)
+    return rows
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare compiled expressions with the interpreter."
+    )
+    parser.add_argument("--backend", choices=BACKENDS, default="float")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--value", type=float, default=1.5)
+    args = parser.parse_args(argv)
+
+    rows = run(args.backend, args.repeat, args.value)
+    print(
+        f"{'expr':<10} {'interp us':>10} {'compiled us':>12} {'speedup':>8} "
+        f"{'raw us':>8} {'compile ms':>11}"
+    )
+    for row in rows:
+        raw = f"{row['raw'] * 1e6:>8.3f}" if "raw" in row else f"{'-':>8}"
+        print(
+            f"{row['name']:<10} {row['interpreted'] * 1e6:>10.3f} "
+            f"{row['compiled'] * 1e6:>12.3f} "
+            f"{row['interpreted'] / row['compiled']:>7.1f}x "
+            f"{raw} {row['compile'] * 1e3:>11.3f}"
+        )
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,178 @@
+import argparse
+import os
+import random
+import sys
+import threading
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import BACKENDS, Calculate  # noqa: E402
+
+
+# Expressions shared by every thread, so they meet in the expression cache;
+# the ones using 'ans' keep it bounded so long chains stay finite
+POOL = [
+    "1+2*3",
+    "(4-1)^2/3",
+    "2^10-24",
+    "1/0",
+    "(0-8)^0.5",
+    "7/2-1.25",
+    "ans/2+3",
+    "ans*0.5-1",
+    "(ans+4)/3",
+    "-ans+10",
+    "ans^2/(ans^2+1)",
+    "ans-ans/4",
+]
+
+# Compiled once per session, then called with a value for x
+COMPILED = ["ans*x+1", "x^2-ans", "(x+ans)/2"]
+
+
+def make_script(seed, steps):
+    # One thread's work: ('calc', expr), ('many', [exprs]) or
+    # ('compiled', index, x), drawn from the shared pool
+    rng = random.Random(seed)
+    script = [("calc", str(seed % 97 + 1))]
+    for _ in range(steps):
+        roll = rng.random()
+        if roll < 0.7:
+            script.append(("calc", rng.choice(POOL)))
+        elif roll < 0.85:
+            script.append(("many", [rng.choice(POOL) for _ in range(8)]))
+        else:
+            script.append(("compiled", rng.randrange(len(COMPILED)), rng.random()))
+    return script
+
+
+def outcome(value, error):
+    return repr(value) if error is None else f"{type(error).__name__}: {error}"
+
+
+def run_script(session, script):
+    # Outcome text per step; successful 'calc' results become the next 'ans'
+    compiled = [session.compile(expr, ("x",)) for expr in COMPILED]
+    outcomes = []
+    for step in script:
+        if step[0] == "calc":
+            try:
+                value = session.calc(step[1])
+            except Exception as e:
+                outcomes.append(outcome(None, e))
+                continue
+            session.add_to_history(step[1], value)
+            outcomes.append(outcome(value, None))
+        elif step[0] == "many":
+            outcomes += [outcome(*pair) for pair in session.calc_many(step[1])]
+        else:
+            try:
+                outcomes.append(outcome(compiled[step[1]](step[2]), None))
+            except Exception as e:
+                outcomes.append(outcome(None, e))
+    return outcomes
+
+
+def expected(scripts, options):
+    # Each script alone on an engine of its own
+    return [run_script(Calculate(**options).session(), script) for script in scripts]
+
+
+def run_threads(calc_engine, scripts, shared_history=False):
+    # Every script on its own thread over one engine, started together
+    results = [None] * len(scripts)
+    errors = []
+    barrier = threading.Barrier(len(scripts))
+
+    def worker(i):
+        session = calc_engine if shared_history else calc_engine.session()
+        barrier.wait()
+        try:
+            results[i] = run_script(session, scripts[i])
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=worker, args=(i,)) for i in range(len(scripts))]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if errors:
+        raise errors[0]
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Run many sessions on one shared engine from many threads "
+        "and check every result against a single-threaded run."
+    )
+    parser.add_argument("--threads", type=int, default=16)
+    parser.add_argument("--steps", type=int, default=5_000, help="steps per thread")
+    parser.add_argument("--rounds", type=int, default=3)
+    parser.add_argument("--backend", choices=BACKENDS, default="float")
+    parser.add_argument(
+        "--cache-size",
+        type=int,
+        default=8,
+        help="expression cache entries; small so threads evict each other's",
+    )
+    parser.add_argument(
+        "--program-cache", metavar="PATH", help="also share an on-disk program cache"
+    )
+    parser.add_argument(
+        "--switch-interval",
+        type=float,
+        default=1e-6,
+        help="seconds between thread switches, small to interleave more",
+    )
+    parser.add_argument(
+        "--shared-history",
+        action="store_true",
+        help="run every thread on the engine's own history instead of a "
+        "session each; expected to fail, to show the check has teeth",
+    )
+    args = parser.parse_args(argv)
+
+    options = {"backend": args.backend, "cache_size": args.cache_size}
+    scripts = [make_script(seed, args.steps) for seed in range(args.threads)]
+    started = time.perf_counter()
+    want = expected(scripts, options)
+    sequential = time.perf_counter() - started
+    steps = sum(len(outcomes) for outcomes in want)
+
+    sys.setswitchinterval(args.switch_interval)
+    mismatches = 0
+    for round_no in range(1, args.rounds + 1):
+        calc_engine = Calculate(program_cache=args.program_cache, **options)
+        started = time.perf_counter()
+        got = run_threads(calc_engine, scripts, args.shared_history)
+        elapsed = time.perf_counter() - started
+
+        wrong = 0
+        for thread, (outcomes, reference) in enumerate(zip(got, want)):
+            for step, (result, correct) in enumerate(zip(outcomes, reference)):
+                if result != correct:
+                    if not wrong:
+                        print(
+                            f"  thread {thread} step {step}: got {result}, "
+                            f"expected {correct}"
+                        )
+                    wrong += 1
+        mismatches += wrong
+        print(
+            f"round {round_no}: {args.threads} threads, {steps} results in "
+            f"{elapsed:.2f}s ({steps / elapsed:,.0f}/s, sequential "
+            f"{steps / sequential:,.0f}/s), {wrong} wrong"
+        )
+        if calc_engine.program_cache is not None:
+            calc_engine.program_cache.close()
+
+    stats = calc_engine.cache.stats()
+    print(f"expression cache: {stats['evictions']} evictions, {stats['hits']} hits")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,194 @@
+import argparse
+import json
+import math
+import os
+import platform
+import sys
+import timeit
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import Calculate  # noqa: E402
+
+
+DEFAULT_SIZES = (100, 1_000, 10_000, 100_000)
+
+# Log-log slope above which a stage is reported as superlinear
+SUPERLINEAR_SLOPE = 1.3
+
+
+# Workloads: each builds an expression whose size grows with n
+def long_sum(n):
+    return "+".join(str(i % 97 + 1) for i in range(n))
+
+
+def nested(n):
+    return "(" * n + "1+2" + ")" * n
+
+
+def mixed(n):
+    ops = "+-*/"
+    return "".join(f"{i % 9 + 1}{ops[i % 4]}" for i in range(n)) + "1"
+
+
+def pow_chain(n):
+    return "^".join(["1"] * n)
+
+
+def mul_div(n):
+    return "".join(f"{i % 9 + 1}{'*/'[i % 2]}" for i in range(n)) + "1"
+
+
+def add_sub(n):
+    return "".join(f"{i % 9 + 1}{'+-'[i % 2]}" for i in range(n)) + "1"
+
+
+# pow, mul_div and add_sub isolate the work of each precedence level, which
+# the old parse_pow, parse_mul_div and parse_add_sub passes used to do
+WORKLOADS = {
+    "length": long_sum,
+    "nesting": nested,
+    "mixed": mixed,
+    "pow": pow_chain,
+    "mul_div": mul_div,
+    "add_sub": add_sub,
+}
+
+
+def stage_functions(calc_engine, expr):
+    # Each stage is timed on its own input, prepared outside the timer
+    tokens = calc_engine.parse_expr(expr)
+    program = calc_engine.parse(expr)
+    return {
+        "tokenize": lambda: calc_engine.parse_expr(expr),
+        "simplify": lambda: calc_engine.simplify(expr),
+        "parse": lambda: calc_engine.parse(expr),
+        "evaluate": lambda: calc_engine.evaluate(program),
+        "calc": lambda: calc_engine.calc(expr),
+    }, len(tokens)
+
+
+def best_time(func, repeat, min_time=0.05):
+    # Best of several runs, each looping until it takes at least min_time
+    timer = timeit.Timer(func)
+    number, _ = timer.autorange()
+    number = max(1, int(number * min_time / 0.2))
+    return min(timer.repeat(repeat, number)) / number
+
+
+def slope(points):
+    # Least-squares slope of log(seconds) against log(size)
+    xs = [math.log(p["size"]) for p in points]
+    ys = [math.log(max(p["seconds"], 1e-12)) for p in points]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    spread = sum((x - mean_x) ** 2 for x in xs)
+    if not spread:
+        return 0.0
+    return sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / spread
+
+
+def run(workloads, sizes, repeat):
+    # No cache, so 'calc' measures a full parse and evaluation every time
+    calc_engine = Calculate(cache_size=0)
+    results = {}
+    for name in workloads:
+        stages = {}
+        for size in sizes:
+            expr = WORKLOADS[name](size)
+            funcs, token_count = stage_functions(calc_engine, expr)
+            for stage, func in funcs.items():
+                seconds = best_time(func, repeat)
+                stages.setdefault(stage, {"points": []})["points"].append(
+                    {
+                        "size": size,
+                        "tokens": token_count,
+                        "seconds": seconds,
+                        "tokens_per_sec": token_count / seconds,
+                    }
+                )
+        for stage in stages.values():
+            stage["slope"] = slope(stage["points"])
+        results[name] = stages
+    return results
+
+
+def compare(results, baseline, tolerance):
+    # Points that got slower than the baseline by more than the tolerance
+    regressions = []
+    for name, stages in results.items():
+        for stage, data in stages.items():
+            old = baseline.get(name, {}).get(stage)
+            if old is None:
+                continue
+            old_points = {p["size"]: p["seconds"] for p in old["points"]}
+            for point in data["points"]:
+                before = old_points.get(point["size"])
+                if before and point["seconds"] > before * (1 + tolerance):
+                    regressions.append(
+                        f"{name}/{stage} n={point['size']}: "
+                        f"{before * 1e3:.3f} ms -> {point['seconds'] * 1e3:.3f} ms"
+                    )
+    return regressions
+
+
+def print_report(results):
+    print(f"{'workload':<9} {'stage':<9} {'n':>8} {'ms':>10} {'tok/s':>12}")
+    for name, stages in results.items():
+        for stage, data in stages.items():
+            for point in data["points"]:
+                print(
+                    f"{name:<9} {stage:<9} {point['size']:>8} "
+                    f"{point['seconds'] * 1e3:>10.3f} {point['tokens_per_sec']:>12.0f}"
+                )
+            flag = "  SUPERLINEAR" if data["slope"] > SUPERLINEAR_SLOPE else ""
+            print(f"{name:<9} {stage:<9} {'slope':>8} {data['slope']:>10.2f}{flag}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Time each Calculate stage over growing expressions."
+    )
+    parser.add_argument(
+        "--workload",
+        action="append",
+        choices=WORKLOADS,
+        help="workload to run (repeatable; default: all)",
+    )
+    parser.add_argument("--sizes", type=int, nargs="+", default=DEFAULT_SIZES)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--save", help="write results as JSON to this file")
+    parser.add_argument("--baseline", help="compare against a saved JSON run")
+    parser.add_argument(
+        "--tolerance",
+        type=float,
+        default=0.25,
+        help="allowed slowdown against the baseline (default: %(default)s)",
+    )
+    args = parser.parse_args(argv)
+
+    results = run(args.workload or list(WORKLOADS), args.sizes, args.repeat)
+    print_report(results)
+
+    if args.save:
+        report = {
+            "python": platform.python_version(),
+            "machine": platform.machine(),
+            "sizes": args.sizes,
+            "results": results,
+        }
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline, encoding="utf-8") as f:
+            baseline = json.load(f)["results"]
+        regressions = compare(results, baseline, args.tolerance)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
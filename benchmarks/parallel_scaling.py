@@ -0,0 +1,52 @@
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from engine import Calculate  # noqa: E402
+from parallel import CHUNK_SIZE, calc_many_parallel  # noqa: E402
+
+
+def make_exprs(count, seed=0):
+    rng = random.Random(seed)
+    return [
+        f"{rng.randint(1, 999)}*{rng.randint(1, 99)}+{rng.randint(1, 9)}^3"
+        f"/({rng.randint(1, 50)}-{rng.random():.3f})"
+        for _ in range(count)
+    ]
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Measure calc_many_parallel throughput per worker count."
+    )
+    parser.add_argument("--count", type=int, default=200_000)
+    parser.add_argument("--chunk-size", type=int, default=CHUNK_SIZE)
+    parser.add_argument("--max-workers", type=int, default=os.cpu_count() or 1)
+    args = parser.parse_args(argv)
+
+    exprs = make_exprs(args.count)
+    start = time.perf_counter()
+    expected = Calculate().calc_many(exprs)
+    baseline = time.perf_counter() - start
+    print(f"{'workers':>7} {'seconds':>8} {'expr/s':>10} {'speedup':>8}")
+    print(f"{'serial':>7} {baseline:8.3f} {args.count / baseline:10.0f} {1:8.2f}")
+
+    workers = 1
+    while workers <= args.max_workers:
+        start = time.perf_counter()
+        results = calc_many_parallel(exprs, workers, args.chunk_size)
+        elapsed = time.perf_counter() - start
+        assert [r for r, _ in results] == [r for r, _ in expected]
+        print(
+            f"{workers:>7} {elapsed:8.3f} {args.count / elapsed:10.0f} "
+            f"{baseline / elapsed:8.2f}"
+        )
+        workers *= 2
+
+
+if __name__ == "__main__":
+    main()
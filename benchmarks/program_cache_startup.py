@@ -0,0 +1,84 @@
+import argparse
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+HERE = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, HERE)
+
+from engine import BACKENDS  # noqa: E402
+
+CLI = os.path.join(HERE, "cli.py")
+
+
+def formula(rng, terms):
+    # A sum of products like the formula sheets the cache is meant for
+    parts = []
+    for _ in range(terms):
+        a, b, c = rng.randint(1, 99), rng.randint(1, 9), rng.randint(1, 9)
+        parts.append(f"{a}*({b}-{c}/{rng.randint(1, 9)})^{rng.randint(1, 3)}")
+    return "+".join(parts)
+
+
+def write_formulas(path, count, terms, seed=0):
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as f:
+        for _ in range(count):
+            f.write(formula(rng, terms) + "\n")
+
+
+def timed_run(args):
+    # Wall time of a whole CLI process, start-up included
+    started = time.perf_counter()
+    subprocess.run([sys.executable, CLI, *args], check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - started
+
+
+def run(count, terms, repeat, backend, workers):
+    with tempfile.TemporaryDirectory() as tmp:
+        formulas = os.path.join(tmp, "formulas.txt")
+        output = os.path.join(tmp, "results.txt")
+        cache = os.path.join(tmp, "programs.bin")
+        write_formulas(formulas, count, terms)
+        common = ["--file", formulas, "--output", output, "--backend", backend]
+        common += ["--workers", str(workers)]
+
+        times = {"uncached": [], "cold": [], "warm": []}
+        for _ in range(repeat):
+            times["uncached"].append(timed_run(common))
+            if os.path.exists(cache):
+                os.unlink(cache)
+            times["cold"].append(timed_run(common + ["--program-cache", cache]))
+            times["warm"].append(timed_run(common + ["--program-cache", cache]))
+        size = os.path.getsize(cache)
+    return {name: min(values) for name, values in times.items()}, size
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Compare CLI runs over a formula file with no program "
+        "cache, an empty one and a warm one."
+    )
+    parser.add_argument("--formulas", type=int, default=50_000)
+    parser.add_argument("--terms", type=int, default=8, help="terms per formula")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--backend", choices=BACKENDS, default="float")
+    parser.add_argument("--workers", type=int, default=1)
+    args = parser.parse_args(argv)
+
+    times, size = run(
+        args.formulas, args.terms, args.repeat, args.backend, args.workers
+    )
+    print(f"{args.formulas} formulas, cache file {size / 1e6:.1f} MB")
+    for name, seconds in times.items():
+        print(f"{name:<9} {seconds:>8.3f} s")
+    print(f"warm vs cold: {times['cold'] / times['warm']:.2f}x faster")
+    # The point of the cache: a warm start must beat a cold one
+    return 0 if times["warm"] < times["cold"] else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,334 @@
+import argparse
+import contextlib
+import json
+import os
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+import types
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from profiling import percentile  # noqa: E402
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+DEFAULT_TRACE = os.path.join(HERE, "traces", "typing.txt")
+DEFAULT_BUDGET = os.path.join(HERE, "ui_latency_budget.json")
+
+# Inputs that start a calculation; their latency runs until the result is
+# shown and the history sidebar has been redrawn
+EQUALS = {"=", "Return", "KP_Enter"}
+
+# Seconds between Tk event-loop passes while waiting
+PUMP_INTERVAL = 0.0002
+
+PERCENTILES = {"p50_ms": 0.50, "p90_ms": 0.90, "p99_ms": 0.99, "max_ms": 1.0}
+
+
+# Traces are plain text, one input per line: the delay in milliseconds
+# since the previous input, 'key' with a Tk keysym or 'click' with a button
+# label, e.g. "120 key plus" or "80 click =". Blank lines and lines
+# starting with '#' are skipped.
+
+
+def read_trace(path):
+    events = []
+    with open(path, encoding="utf-8") as f:
+        for line_no, line in enumerate(f, 1):
+            line = line.strip()
+            if not line or line[0] == "#":
+                continue
+            try:
+                delay, kind, value = line.split(maxsplit=2)
+                delay = float(delay) / 1000
+            except ValueError:
+                raise ValueError(f"{path}:{line_no}: expected 'delay kind value'")
+            if kind not in ("key", "click"):
+                raise ValueError(f"{path}:{line_no}: unknown input kind '{kind}'")
+            events.append((delay, kind, value))
+    return events
+
+
+def write_trace(events, path):
+    with open(path, "w", encoding="utf-8") as f:
+        f.write("# delay_ms kind value\n")
+        for delay, kind, value in events:
+            f.write(f"{delay * 1000:.0f} {kind} {value}\n")
+
+
+def category(kind, value):
+    return "equals" if value in EQUALS else "input"
+
+
+@contextlib.contextmanager
+def virtual_display():
+    # Use the current display if there is one, otherwise run Xvfb for the
+    # duration of the benchmark
+    if os.environ.get("DISPLAY"):
+        yield
+        return
+    xvfb = shutil.which("Xvfb")
+    if xvfb is None:
+        raise SystemExit("no display: set DISPLAY or install Xvfb")
+
+    number = 90 + os.getpid() % 100
+    server = subprocess.Popen(
+        [xvfb, f":{number}", "-screen", "0", "1280x800x24", "-nolisten", "tcp"],
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+    )
+    try:
+        deadline = time.monotonic() + 10
+        while not os.path.exists(f"/tmp/.X11-unix/X{number}"):
+            if server.poll() is not None or time.monotonic() > deadline:
+                raise SystemExit("Xvfb did not start")
+            time.sleep(0.05)
+        os.environ["DISPLAY"] = f":{number}"
+        yield
+    finally:
+        os.environ.pop("DISPLAY", None)
+        server.terminate()
+        server.wait()
+
+
+def fill_history(path, count):
+    from engine import format_result
+    from history_db import HistoryStore
+
+    store = HistoryStore(path)
+    for i in range(count):
+        value = i * 1.5
+        store.add(f"{i}*1.5", value, format_result(value))
+    store.close()
+
+
+def make_app(history_path, show_sidebar=True):
+    import calculator
+
+    # Never touch the user's own history
+    calculator.HISTORY_DB = history_path
+    app = calculator.App()
+    if show_sidebar:
+        app.toggle_sidebar()
+    app.update()
+    return app
+
+
+class Replayer:
+    # Feeds inputs to a running App the way Tk would and times each one,
+    # from the call into ButtonsFrame until the display was last written
+    # before the app went idle again
+    def __init__(self, app):
+        self.app = app
+        self.last_write = None
+        app.display_frame.expression.trace_add("write", self.on_write)
+
+    def on_write(self, *args):
+        self.last_write = time.perf_counter()
+
+    def busy(self):
+        buttons = self.app.buttons_frame
+        return bool(
+            buttons.pending_keys or buttons.flush_scheduled or buttons.job is not None
+        )
+
+    def pump(self, until):
+        while time.perf_counter() < until:
+            self.app.update()
+            time.sleep(PUMP_INTERVAL)
+
+    def fire(self, kind, value):
+        buttons = self.app.buttons_frame
+        if kind == "key":
+            event = types.SimpleNamespace(widget=self.app, keysym=value)
+            buttons.handle_keypress(event)
+        else:
+            buttons.on_button_click(value)
+
+    def replay(self, events, speed=1.0, timeout=10.0):
+        # (category, seconds) per input. Recorded delays are scaled by
+        # 'speed'; 0 sends each input as soon as the previous one is done.
+        latencies = []
+        for delay, kind, value in events:
+            if speed:
+                self.pump(time.perf_counter() + delay / speed)
+            self.last_write = None
+            started = time.perf_counter()
+            self.fire(kind, value)
+            while self.busy():
+                if time.perf_counter() - started > timeout:
+                    raise RuntimeError(f"'{kind} {value}' still busy after {timeout}s")
+                self.app.update()
+                time.sleep(PUMP_INTERVAL)
+            finished = self.last_write or time.perf_counter()
+            latencies.append((category(kind, value), finished - started))
+        return latencies
+
+
+def summarize(latencies):
+    summary = {}
+    for name in sorted({name for name, _ in latencies}):
+        values = [seconds for other, seconds in latencies if other == name]
+        summary[name] = {"count": len(values)}
+        for key, q in PERCENTILES.items():
+            summary[name][key] = percentile(values, q) * 1000
+    return summary
+
+
+def over_budget(summary, budget):
+    # Messages for every measured percentile above its budget
+    failures = []
+    for name, limits in budget.items():
+        for key, limit in limits.items():
+            measured = summary.get(name, {}).get(key)
+            if measured is not None and measured > limit:
+                failures.append(f"{name} {key}: {measured:.1f} ms > {limit:.1f} ms")
+    return failures
+
+
+def record(path, history_path):
+    # Run the calculator normally and save every key press and button click
+    # as a trace when the window is closed
+    import calculator
+    import tkinter
+
+    app = make_app(history_path, show_sidebar=False)
+    buttons = app.buttons_frame
+    events = []
+    last = [time.perf_counter()]
+
+    def log(kind, value):
+        now = time.perf_counter()
+        events.append((now - last[0], kind, value))
+        last[0] = now
+
+    def on_key(event):
+        # Same keys as ButtonsFrame.handle_keypress, minus the one that quits
+        key = calculator.KEYSYM_TO_CHAR.get(event.keysym)
+        if key is not None and key != "quit":
+            if not isinstance(event.widget, tkinter.Entry):
+                log("key", event.keysym)
+
+    # Typed '=' also reaches on_button_click, from flush_keys; only log the
+    # calls made by the buttons themselves
+    click = buttons.on_button_click
+    flush = buttons.flush_keys
+    flushing = [False]
+
+    def on_click(text):
+        if not flushing[0]:
+            log("click", text)
+        click(text)
+
+    def on_flush():
+        flushing[0] = True
+        try:
+            flush()
+        finally:
+            flushing[0] = False
+
+    app.bind("<Key>", on_key, add="+")
+    buttons.on_button_click = on_click
+    buttons.flush_keys = on_flush
+    app.mainloop()
+    write_trace(events, path)
+    print(f"recorded {len(events)} inputs to {path}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Replay keystroke traces against the GUI and report "
+        "input-to-display latency."
+    )
+    parser.add_argument(
+        "--trace",
+        action="append",
+        help=f"trace file to replay, may be repeated (default: {DEFAULT_TRACE})",
+    )
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument(
+        "--speed",
+        type=float,
+        default=1.0,
+        help="replay speed-up of the recorded delays; 0 for no delays",
+    )
+    parser.add_argument(
+        "--history",
+        type=int,
+        default=100_000,
+        help="entries in the history before replaying (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--no-sidebar", action="store_true", help="keep the history sidebar closed"
+    )
+    parser.add_argument(
+        "--budget",
+        default=DEFAULT_BUDGET,
+        help="JSON latency budget to check (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--write-budget",
+        help="write the measured percentiles times --headroom as a new budget",
+    )
+    parser.add_argument("--headroom", type=float, default=1.5)
+    parser.add_argument("--save", help="write the results as JSON to this file")
+    parser.add_argument(
+        "--record", metavar="FILE", help="record a trace from a normal session"
+    )
+    args = parser.parse_args(argv)
+
+    with tempfile.TemporaryDirectory() as tmp, virtual_display():
+        history_path = os.path.join(tmp, "history.db")
+        if args.record:
+            record(args.record, history_path)
+            return 0
+
+        fill_history(history_path, args.history)
+        events = []
+        for path in args.trace or [DEFAULT_TRACE]:
+            events += read_trace(path)
+
+        app = make_app(history_path, not args.no_sidebar)
+        try:
+            replayer = Replayer(app)
+            latencies = []
+            for _ in range(args.repeat):
+                latencies += replayer.replay(events, args.speed)
+        finally:
+            app.destroy()
+
+    summary = summarize(latencies)
+    print(f"{'inputs':<8} {'count':>6} " + " ".join(f"{k:>8}" for k in PERCENTILES))
+    for name, row in summary.items():
+        print(
+            f"{name:<8} {row['count']:>6} "
+            + " ".join(f"{row[key]:>8.2f}" for key in PERCENTILES)
+        )
+
+    if args.save:
+        report = {"history": args.history, "speed": args.speed, "results": summary}
+        with open(args.save, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+    if args.write_budget:
+        budget = {
+            name: {
+                key: round(row[key] * args.headroom, 1)
+                for key in ("p50_ms", "p99_ms")
+            }
+            for name, row in summary.items()
+        }
+        with open(args.write_budget, "w", encoding="utf-8") as f:
+            json.dump(budget, f, indent=2)
+        return 0
+
+    with open(args.budget, encoding="utf-8") as f:
+        failures = over_budget(summary, json.load(f))
+    for failure in failures:
+        print(f"over budget: {failure}")
+    return 1 if failures else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
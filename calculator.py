@@ -1,256 +1,257 @@
-import customtkinter
-import re
-import tkinter
-
-
-MAX_NUMBER = 1e25
-
-
-class Calculate:
-    def __init__(self):
-        # Map operators to their corresponding functions
-        self.operations = {
-            "+": self.add,
-            "-": self.sub,
-            "*": self.mul,
-            "/": self.div,
-            "^": self.pows,
-        }
-        self.history = []
-
-    # History management methods
-    def add_to_history(self, expr, result):
-        self.history.insert(0, (expr, result))
-
-    def get_last_ans(self):
-        return self.history[0][1] if self.history else "empty"
-
-    # Basic arithmetic operations
-    def add(self, a, b):
-        return a + b
-
-    def sub(self, a, b):
-        return a - b
-
-    def mul(self, a, b):
-        return a * b
-
-    def div(self, a, b):
-        # Check for division by zero with floating point precision
-        if abs(b) < 1e-15:
-            raise ZeroDivisionError("division by zero")
-        return a / b
-
-    def pows(self, a, b):
-        return a**b
-
-    # Expression parsing: convert string to tokens
-    def parse_expr(self, expr: str) -> list[str]:
-        # Split expression into numbers and operators
-        tokens = re.findall(r"\d+(?:\.\d+)?|[+\-*/^]", expr)
-        parsed_tokens = []
-        i = 0
-
-        # Handle unary minus at the beginning
-        if tokens and tokens[0] == "-":
-            parsed_tokens.append(str(-float(tokens[1])))
-            i = 2
-
-        # Main parsing loop
-        while i < len(tokens):
-            if (
-                tokens[i] in self.operations
-                and i + 2 < len(tokens)
-                and tokens[i + 1] == "-"
-            ):
-                # Handle unary minus after operator
-                parsed_tokens.append(tokens[i])
-                parsed_tokens.append(str(-float(tokens[i + 2])))
-                i += 3
-            else:
-                parsed_tokens.append(tokens[i])
-                i += 1
-        return parsed_tokens
-
-    # Power operations (highest precedence)
-    def parse_pow(self, tokens: list[str]) -> list[str]:
-        output = []
-        i = len(tokens) - 1
-
-        while i >= 0:
-            token = tokens[i]
-            if token.replace(".", "", 1).isdigit():
-                base = float(token)
-                # Process power chain from right to left
-                while i - 2 >= 0 and tokens[i - 1] == "^":
-                    exp = float(tokens[i - 2])
-                    base = self.operations["^"](exp, base)
-                    i -= 2
-                output.insert(0, str(base))
-            else:
-                output.insert(0, token)
-            i -= 1
-        return output
-
-    # Multiplication and division (medium precedence)
-    def parse_mul_div(self, tokens: list[str]) -> list[str]:
-        output = []
-        i = 0
-
-        while i < len(tokens):
-            token = tokens[i]
-            if token.replace(".", "", 1).isdigit():
-                value = float(token)
-                # Process multiplication and division chain
-                while i + 2 < len(tokens) and tokens[i + 1] in ("*", "/"):
-                    op = tokens[i + 1]
-                    next_val = float(tokens[i + 2])
-                    value = self.operations[op](value, next_val)
-                    i += 2
-                output.append(str(value))
-            else:
-                output.append(token)
-            i += 1
-        return output
-
-    # Addition and subtraction (lowest precedence)
-    def parse_add_sub(self, tokens: list[str]) -> float:
-        result = float(tokens[0])
-        i = 1
-        while i + 1 < len(tokens):
-            op = tokens[i]
-            value = float(tokens[i + 1])
-            result = self.operations[op](result, value)
-            i += 2
-        return result
-
-    # Main calculation method
-
-    def calc(self, expr: str) -> float:
-        tokens = self.parse_expr(expr)
-
-        if "^" in tokens:
-            tokens = self.parse_pow(tokens)
-
-        if "*" in tokens or "/" in tokens:
-            tokens = self.parse_mul_div(tokens)
-
-        result = self.parse_add_sub(tokens)
-        return result
-
-    # Expression preprocessing: handle parentheses and 'ans' replacement
-
-    def simplify(self, expr: str) -> str:
-        if "ans" in expr:
-            expr = expr.replace("ans", str(self.get_last_ans()))
-
-        # Auto-close parentheses if needed
-        open_count = expr.count("(")
-        close_count = expr.count(")")
-        if open_count > close_count:
-            expr += ")" * (open_count - close_count)
-
-        # Process nested parentheses
-        while "(" in expr:
-            open_indices = []
-            for i, char in enumerate(expr):
-                if char == "(":
-                    open_indices.append(i)
-                elif char == ")":
-                    start = open_indices.pop()
-                    inner = expr[start + 1 : i]
-
-                    # Skip empty parentheses
-                    if inner.strip() == "":
-                        expr = expr[:start] + expr[i + 1 :]
-                        break
-
-                    result = float(self.calc(inner))
-
-                    # Handle minus before parentheses: -(...)
-                    if start > 0 and expr[start - 1] == "-":
-
-                        if start == 1 or expr[start - 2] in "+-*/^(":
-
-                            result = -result
-                            expr = expr[: start - 1] + str(result) + expr[i + 1 :]
-                        else:
-
-                            if result < 0:
-
-                                expr = (
-                                    expr[: start - 1]
-                                    + "+"
-                                    + str(-result)
-                                    + expr[i + 1 :]
-                                )
-                            else:
-
-                                expr = expr[: start - 1] + str(-result) + expr[i + 1 :]
-                    else:
-
-                        expr = expr[:start] + str(result) + expr[i + 1 :]
-                    break
-
-        return expr
+import time
+
+# Taken before the other imports, so the startup trace can time them
+STARTED = time.perf_counter()
+
+import argparse  # noqa: E402
+import copy  # noqa: E402
+import customtkinter  # noqa: E402
+import os  # noqa: E402
+import queue  # noqa: E402
+import sys  # noqa: E402
+import tkinter  # noqa: E402
+from concurrent.futures import ThreadPoolExecutor  # noqa: E402
+
+from engine import (  # noqa: E402
+    Budget,
+    Calculate,
+    IncrementalEvaluator,
+    format_result,
+    is_array,
+)
+from history_db import HistoryStore  # noqa: E402
+
+IMPORTED = time.perf_counter()
+
+
+# Colours shared by every widget
+BACKGROUND = "#2B2D31"
+PANEL = "#2A2B31"
+LIST = "#3A3B41"
+FIELD = "#464850"
+BUTTON = "#3E4C5A"
+BUTTON_HOVER = "#2D3B4F"
+EXIT_HOVER = "#732027"
+TEXT = "#D0BCFF"
+PREVIEW_TEXT = "#8E8A99"
+ACCENT = "#B69DF8"
+
+MONO = "JetBrains Mono"
+
+# Fonts by (size, weight, family). Each is created once the window exists
+# and shared by every widget that uses it.
+FONTS = {}
+
+
+def shared_font(size, weight="normal", family=None):
+    key = (size, weight, family)
+    if key not in FONTS:
+        FONTS[key] = customtkinter.CTkFont(family=family, size=size, weight=weight)
+    return FONTS[key]
+
+
+class StartupTrace:
+    # Time spent on imports, on building each part of the window and until
+    # the first frame is drawn; printed on stderr with --trace-startup
+    def __init__(self, started=STARTED, imported=IMPORTED, exit_when_drawn=False):
+        self.marks = [("start", started), ("imports", imported)]
+        self.exit_when_drawn = exit_when_drawn
+
+    def mark(self, stage):
+        self.marks.append((stage, time.perf_counter()))
+
+    def report(self):
+        parts = [
+            f"{stage} {(end - start) * 1000:.1f} ms"
+            for (_, start), (stage, end) in zip(self.marks, self.marks[1:])
+        ]
+        total = (self.marks[-1][1] - self.marks[0][1]) * 1000
+        return f"startup: {', '.join(parts)}; total {total:.1f} ms"
+
+
+# Row widgets in the history sidebar; scrolling reuses them
+HISTORY_ROWS = 12
+
+# Keyboard keys and the calculator input they stand for
+KEYSYM_TO_CHAR = {
+    "0": "0",
+    "1": "1",
+    "2": "2",
+    "3": "3",
+    "4": "4",
+    "5": "5",
+    "6": "6",
+    "7": "7",
+    "8": "8",
+    "9": "9",
+    "KP_1": "1",
+    "KP_2": "2",
+    "KP_3": "3",
+    "KP_4": "4",
+    "KP_5": "5",
+    "KP_6": "6",
+    "KP_7": "7",
+    "KP_8": "8",
+    "KP_9": "9",
+    "KP_0": "0",
+    "period": ".",
+    "KP_Decimal": ".",
+    "plus": "+",
+    "KP_Add": "+",
+    "minus": "-",
+    "KP_Subtract": "-",
+    "slash": "/",
+    "KP_Divide": "/",
+    "asterisk": "*",
+    "KP_Multiply": "*",
+    "asciicircum": "^",
+    "parenleft": "(",
+    "parenright": ")",
+    "bracketleft": "[",
+    "bracketright": "]",
+    "comma": ",",
+    "at": "@",
+    "KP_Enter": "=",
+    "Return": "=",
+    "Delete": "clear",
+    "BackSpace": "sclear",
+    "Escape": "quit",
+}
+
+ALLOWED_CHARS = frozenset("0123456789.+-*/^()[],@")
+
+OPERATORS = frozenset("+-*/^@")
+
+# Keystrokes are drawn at most once per frame (s); keys that arrive in
+# between are applied together
+FRAME_TIME = 1 / 60
+
+# History kept between sessions
+HISTORY_DB = os.path.join(os.path.expanduser("~"), ".calculator_history.db")
+
+# How often the Tk loop checks for a finished background calculation (ms)
+RESULT_POLL_MS = 15
+
+# Rows shown in the table window; longer ranges are cut off
+TABLE_ROWS = 1000
 
 
 class App(customtkinter.CTk):
-    def __init__(self):
-        super().__init__(fg_color="#2B2D31")
+    def __init__(self, trace=None):
+        self.trace = trace
+        super().__init__(fg_color=BACKGROUND)
+        self.mark("window")
         self.sidebar_width = 200
         self.main_width = 400
         self.height = 550
 
         self.title("Calculator")
         self.geometry(f"{self.main_width}x{self.height}")
-        self.calc_engine = Calculate()
+        # Keep a pasted or pathological expression from hanging the window
+        self.calc_engine = Calculate(budget=Budget(max_tokens=100_000, timeout=2.0))
+
+        # Saved history; 'ans' continues from the last session
+        self.history_store = HistoryStore(HISTORY_DB)
+        last = self.history_store.last()
+        if last is not None and last[1] is not None:
+            self.calc_engine.add_to_history(*last)
+        self.mark("history")
 
         # Main container for all primary frames
-        self.main_panel = customtkinter.CTkFrame(self, fg_color="#2B2D31")
+        self.main_panel = customtkinter.CTkFrame(self, fg_color=BACKGROUND)
         self.main_panel.pack(side="left", fill="both", expand=True)
-        self.display_frame = DisplayFrame(self.main_panel)
-
-        # Sidebar panel, initially hidden
+        self.display_frame = DisplayFrame(self.main_panel, self.calc_engine)
         self.display_frame.pack(pady=10, fill="x")
-        self.sidebar_frame = SidebarPanel(
-            self,
-            self.display_frame,
-            self.calc_engine,
-        )
+        self.mark("display")
 
-        self.control_frame = ControlFrame(
-            self.main_panel, self.display_frame, self.sidebar_frame, self
-        )
+        # The sidebar starts hidden and is built the first time it is shown
+        self.sidebar_frame = None
+
+        self.control_frame = ControlFrame(self.main_panel, self.display_frame, self)
         self.control_frame.pack(pady=5, fill="x")
+        self.mark("controls")
 
         self.buttons_frame = ButtonsFrame(
             self.main_panel,
             self.display_frame,
             self.calc_engine,
-            self.sidebar_frame,
             self,
         )
         self.buttons_frame.pack(pady=5, fill="x")
+        self.mark("buttons")
 
         self.bind("<Key>", self.buttons_frame.handle_keypress)
+        self.bind("<Control-v>", self.buttons_frame.paste)
+        self.bind("<Control-t>", lambda e: self.open_table())
+        self.table_window = None
+
+        if trace is not None:
+            self.bind("<Map>", self.on_first_map, add="+")
+
+    def mark(self, stage):
+        if self.trace is not None:
+            self.trace.mark(stage)
+
+    def on_first_map(self, event):
+        # The first frame is drawn by the idle tasks queued once the window
+        # is mapped
+        if event.widget is self and self.trace is not None:
+            self.after_idle(self.report_startup)
+
+    def report_startup(self):
+        trace = self.trace
+        if trace is None:
+            return
+        self.mark("first frame")
+        self.trace = None
+        print(trace.report(), file=sys.stderr)
+        if trace.exit_when_drawn:
+            self.destroy()
+
+    def sidebar(self):
+        if self.sidebar_frame is None:
+            self.sidebar_frame = SidebarPanel(
+                self, self.display_frame, self.history_store
+            )
+        return self.sidebar_frame
+
+    def toggle_sidebar(self):
+        self.sidebar().toggle_sidebar()
+
+    def open_table(self):
+        # One table window; reopening brings it to the front
+        if self.table_window is None or not self.table_window.winfo_exists():
+            self.table_window = TableWindow(self, self.calc_engine)
+        else:
+            self.table_window.focus()
+
+    def destroy(self):
+        # Stop a running calculation so the worker thread does not delay exit
+        self.buttons_frame.shutdown()
+        self.history_store.close()
+        # Fonts belong to this window's Tk interpreter
+        FONTS.clear()
+        super().destroy()
 
 
 class DisplayFrame(customtkinter.CTkFrame):
-    def __init__(self, parent):
-        super().__init__(parent, height=100, fg_color="#2B2D31")
+    def __init__(self, parent, calc_engine):
+        super().__init__(parent, height=100, fg_color=BACKGROUND)
         self.result_displayed = False
         self.minus_flag = False
         self.expression = customtkinter.StringVar()
+        self.preview_text = customtkinter.StringVar()
+        self.evaluator = IncrementalEvaluator(calc_engine)
+        self.computing = False
         self.entry = customtkinter.CTkEntry(
             self,
             placeholder_text="Enter smth...",
             textvariable=self.expression,
-            font=("JetBrains Mono", 24),
+            font=shared_font(24, family=MONO),
             justify="right",
             height=100,
-            text_color="#D0BCFF",
-            fg_color="#464850",
+            text_color=TEXT,
+            fg_color=FIELD,
         )
         self.entry.pack(fill="x", padx=10)
         self.entry.configure(state="readonly")
@@ -260,34 +261,70 @@ class DisplayFrame(customtkinter.CTkFrame):
         self.entry.bind("<Button-1>", lambda e: "break")
         self.entry.bind("<Key>", lambda e: "break")
 
+        # Running result preview, updated whenever the expression changes
+        self.preview = customtkinter.CTkLabel(
+            self,
+            textvariable=self.preview_text,
+            font=shared_font(16, family=MONO),
+            text_color=PREVIEW_TEXT,
+            anchor="e",
+        )
+        self.preview.pack(fill="x", padx=14)
+        self.expression.trace_add("write", self.update_preview)
+
+    def set_computing(self, val: bool):
+        self.computing = val
+        self.update_preview()
+
+    def update_preview(self, *args):
+        if self.computing:
+            self.preview_text.set("computing…")
+            return
+
+        expr = self.expression.get()
+        self.evaluator.sync(expr)
+        value, error = self.evaluator.preview()
+
+        # Hide the preview when it would only repeat the entry
+        text = ""
+        if value is not None:
+            try:
+                text = format_result(value)
+            except OverflowError:
+                text = ""
+            if text == expr:
+                text = ""
+        self.preview_text.set(f"= {text}" if text else "")
+
     def get_expression(self):
         return self.expression.get()
 
     def append_expression(self, value):
-        operators = set("+-*/^")
-        operators_no_minus = set("+*/^")
+        self.set_expression(self.appended(self.expression.get(), value))
 
-        expr = self.expression.get()
+    def set_expression(self, expr):
+        # Every write redraws the entry and the preview, so skip no-ops
+        if expr != self.expression.get():
+            self.expression.set(expr)
 
+    def appended(self, expr, value):
+        # The expression after typing one character; used for single keys
+        # and for batches of queued keys, which are drawn once at the end
         if self.result_displayed:
-            if value in operators:
-                self.expression.set(expr + value)
-            else:
-                self.expression.set(value)
             self.result_displayed = False
-            return
+            return expr + value if value in OPERATORS else value
 
         # Remove duplicate operators (if consecutive)
-        if expr and expr[-1] in operators and value in operators_no_minus:
+        if expr and expr[-1] in OPERATORS and value in OPERATORS and value != "-":
             expr = expr[:-1]
 
         # Handle unary minus with parentheses
-        if expr and expr[-1] in operators and value == "-":
+        if expr and expr[-1] in OPERATORS and value == "-":
             expr += "("
             self.minus_flag = True
 
         # Close unary parentheses if next input is operator
-        elif expr and value in operators and self.minus_flag:
+        elif expr and value in OPERATORS and self.minus_flag:
             expr += ")"
             self.minus_flag = False
 
@@ -296,8 +333,15 @@ class DisplayFrame(customtkinter.CTkFrame):
             expr += "*"
 
         # Append the value
-        expr += value
-        self.expression.set(expr)
+        return expr + value
+
+    def pasted(self, expr, text):
+        # A pasted expression is inserted as-is, without the typing rules
+        self.minus_flag = False
+        if self.result_displayed:
+            self.result_displayed = False
+            return expr + text if text[0] in OPERATORS else text
+        return expr + text
 
     def some_clear(self):
         current_val = self.expression.get()
@@ -313,13 +357,26 @@ class DisplayFrame(customtkinter.CTkFrame):
 
 class ButtonsFrame(customtkinter.CTkFrame):
 
-    def __init__(self, parent, display_frame, calc_engine, sidebar_frame, app):
-        super().__init__(parent, fg_color="#2A2B31")
+    def __init__(self, parent, display_frame, calc_engine, app):
+        super().__init__(parent, fg_color=PANEL)
         self.display = display_frame
         self.calc_engine = calc_engine
-        self.sidebar_frame = sidebar_frame
         self.app = app
 
+        # '=' runs on a single worker thread; results come back via a queue
+        # polled from the Tk loop, so widgets are only touched on this thread
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.results = queue.Queue()
+        self.base_budget = calc_engine.budget
+        self.job_id = 0
+        self.job = None
+        self.polling = False
+
+        # Keystrokes waiting to be applied to the expression
+        self.pending_keys = []
+        self.flush_scheduled = False
+        self.last_flush = 0.0
+
         # Button layout configuration
         buttons = [
             "7",
@@ -351,127 +408,191 @@ class ButtonsFrame(customtkinter.CTkFrame):
                 self,
                 command=lambda t=btn_text: self.on_button_click(t),
                 text=btn_text,
-                fg_color="#3E4C5A",
+                fg_color=BUTTON,
                 width=90,
                 height=60,
-                border_color="#3E4C5A",
-                hover_color="#2D3B4F",
-                text_color="#D0BCFF",
-                font=("JetBrains Mono", 24),
+                border_color=BUTTON,
+                hover_color=BUTTON_HOVER,
+                text_color=TEXT,
+                font=shared_font(24, family=MONO),
             )
             button.grid(row=i // 4, column=i % 4, padx=5, pady=5)
 
     def handle_keypress(self, event):
-        allowed_chars = set("0123456789.+-*/^()")
-
-        # Map keyboard keys to calculator functions
-        keysym_to_char = {
-            "0": "0",
-            "1": "1",
-            "2": "2",
-            "3": "3",
-            "4": "4",
-            "5": "5",
-            "6": "6",
-            "7": "7",
-            "8": "8",
-            "9": "9",
-            "KP_1": "1",
-            "KP_2": "2",
-            "KP_3": "3",
-            "KP_4": "4",
-            "KP_5": "5",
-            "KP_6": "6",
-            "KP_7": "7",
-            "KP_8": "8",
-            "KP_9": "9",
-            "KP_0": "0",
-            "period": ".",
-            "KP_Decimal": ".",
-            "plus": "+",
-            "KP_Add": "+",
-            "minus": "-",
-            "KP_Subtract": "-",
-            "slash": "/",
-            "KP_Divide": "/",
-            "asterisk": "*",
-            "KP_Multiply": "*",
-            "asciicircum": "^",
-            "parenleft": "(",
-            "parenright": ")",
-            "KP_Enter": "=",
-            "Return": "=",
-            "Delete": "clear",
-            "BackSpace": "sclear",
-            "Escape": "quit",
-        }
-
-        key = keysym_to_char.get(event.keysym)
-
-        # Handle different key types
-        match key:
-            case k if k in allowed_chars:
-                self.display.append_expression(k)
-            case "=":
-                self.on_button_click("=")
-            case "sclear":
-                self.display.some_clear()
-            case "clear":
-                self.display.clear_expression()
-            case "quit":
-                self.app.destroy()
+        # Typing in a text field, such as the history search, is not input
+        if isinstance(event.widget, tkinter.Entry):
+            return
 
-    def on_button_click(self, text):
-        if text == "=":
-            try:
+        key = KEYSYM_TO_CHAR.get(event.keysym)
+        if key is not None:
+            self.pending_keys.append(key)
+            self.schedule_flush()
+
+    def paste(self, event=None):
+        if event is not None and isinstance(event.widget, tkinter.Entry):
+            return
+        try:
+            text = " ".join(self.app.clipboard_get().split())
+            # Only something the engine can tokenize is pasted
+            if text:
+                self.calc_engine.parse_expr(text)
+        except (tkinter.TclError, ValueError):
+            return
+        if text:
+            self.pending_keys.append(("paste", text))
+            self.schedule_flush()
+        return "break"
+
+    def schedule_flush(self):
+        # Queued keys are drawn once the pending events are handled, and no
+        # sooner than a frame after the previous flush
+        if self.flush_scheduled:
+            return
+        self.flush_scheduled = True
+        wait = self.last_flush + FRAME_TIME - time.perf_counter()
+        if wait > 0:
+            self.after(int(wait * 1000) + 1, self.flush_keys)
+        else:
+            self.after_idle(self.flush_keys)
+
+    def flush_keys(self):
+        self.flush_scheduled = False
+        self.last_flush = time.perf_counter()
+        keys = self.pending_keys
+        self.pending_keys = []
+
+        # Edit a local copy and write the entry once at the end
+        expr = self.display.get_expression()
+        for key in keys:
+            if key.__class__ is tuple:
+                expr = self.display.pasted(expr, key[1])
+            elif key in ALLOWED_CHARS:
+                expr = self.display.appended(expr, key)
+            elif key == "sclear":
+                expr = expr[:-1]
+            elif key == "clear":
+                expr = ""
+            else:
+                # '=' and Escape act on everything typed before them
+                self.display.set_expression(expr)
+                if key == "=":
+                    self.on_button_click("=")
+                elif self.job is not None:
+                    # Escape cancels a running calculation before it quits
+                    self.cancel_calculation()
+                else:
+                    self.app.destroy()
+                    return
                 expr = self.display.get_expression()
-                simplified_expr = self.calc_engine.simplify(expr)
-                result = self.calc_engine.calc(simplified_expr)
-
-                # Format result appropriately
-                if result.is_integer():
-                    result = int(result)
-                if abs(result) > MAX_NUMBER:
-                    raise OverflowError("Number is too big")
-                if abs(result) > 1_000_000_000:
-                    result = "{:.6e}".format(result)
-
-                # Add to history and update display
-                self.calc_engine.add_to_history(expr, str(result))
-                self.display.expression.set(str(result))
-                self.display.result_displayed = True
-                self.sidebar_frame.print_history()
+        self.display.set_expression(expr)
 
-            except Exception as e:
-                self.display.expression.set(f"Error: {e}")
-                self.display.result_displayed = True
-            except OverflowError as e:
-                self.display.expression.set(f"Error: {e}")
-                self.display.result_displayed = True
+    def on_button_click(self, text):
+        if text == "=":
+            self.start_calculation()
 
         elif text == "ans":
             # Insert last answer if available
             last_ans = self.calc_engine.get_last_ans()
-            if last_ans != "empty":
-                self.display.append_expression(str(last_ans))
+            if is_array(last_ans):
+                # The displayed form of a long array is shortened with
+                # '...' and cannot be read back, so refer to it by name
+                self.display.append_expression("ans")
+            elif last_ans.__class__ is not str:
+                self.display.append_expression(format_result(last_ans))
         else:
             # Regular input handling
             self.display.append_expression(text)
 
+    def start_calculation(self):
+        # A new '=' replaces any calculation still in flight
+        self.cancel_calculation()
+        expr = self.display.get_expression()
+
+        # Each calculation gets its own budget so cancelling it cannot
+        # affect the next one
+        budget = copy.copy(self.base_budget) if self.base_budget else Budget()
+        budget.reset()
+        self.job_id += 1
+        self.job = (self.job_id, budget)
+        self.display.set_computing(True)
+        self.executor.submit(self.calculate, self.job_id, expr, budget)
+
+        if not self.polling:
+            self.polling = True
+            self.after(RESULT_POLL_MS, self.poll_result)
+
+    def calculate(self, job_id, expr, budget):
+        # Runs on the worker thread and must not touch any widget
+        try:
+            # The job's budget is passed in, so the engine's own is never
+            # replaced by one that may be cancelled
+            simplified_expr = self.calc_engine.simplify(expr)
+            value = self.calc_engine.calc(simplified_expr, budget)
+            result = format_result(value)
+            self.results.put((job_id, expr, value, result, None))
+        except Exception as e:
+            self.results.put((job_id, expr, None, None, e))
+
+    def cancel_calculation(self):
+        if self.job is not None:
+            self.job[1].cancel()
+            self.job = None
+            self.display.set_computing(False)
+
+    def poll_result(self):
+        while True:
+            try:
+                job_id, expr, value, result, error = self.results.get_nowait()
+            except queue.Empty:
+                break
+            # Results of cancelled calculations are dropped
+            if self.job is not None and job_id == self.job[0]:
+                self.job = None
+                self.display.set_computing(False)
+                self.show_result(expr, value, result, error)
+
+        if self.job is not None:
+            self.after(RESULT_POLL_MS, self.poll_result)
+        else:
+            self.polling = False
+
+    def show_result(self, expr, value, result, error):
+        # Leave the entry alone if it was edited while calculating
+        edited = self.display.get_expression() != expr
+
+        if error is None:
+            # Add to history and update display
+            self.calc_engine.add_to_history(expr, value)
+            self.app.history_store.add(expr, value, result)
+            # 'ans' changed, so previously evaluated prefixes are stale
+            self.display.evaluator.clear()
+            if self.app.sidebar_frame is not None:
+                self.app.sidebar_frame.print_history()
+            if not edited:
+                self.display.expression.set(result)
+                self.display.result_displayed = True
+        elif not edited:
+            self.display.expression.set(f"Error: {error}")
+            self.display.result_displayed = True
+
+    def shutdown(self):
+        self.cancel_calculation()
+        self.executor.shutdown(wait=False)
+
 
 class SidebarPanel(customtkinter.CTkFrame):
     def __init__(
         self,
         app,
         display_frame,
-        calc_engine,
+        history_store,
         width=200,
     ):
-        super().__init__(app, width=width, fg_color="#2A2B31")
+        super().__init__(app, width=width, fg_color=PANEL)
 
         self.app = app
         self.sidebar_visible = False
-        self.calc_engine = calc_engine
+        self.history_store = history_store
         self.pack_propagate(False)
         self.display = display_frame
 
@@ -484,8 +605,8 @@ class SidebarPanel(customtkinter.CTkFrame):
         self.switch = customtkinter.CTkSwitch(
             top_frame,
             text="Result",
-            text_color="#D0BCFF",
-            progress_color="#B69DF8",
+            text_color=TEXT,
+            progress_color=ACCENT,
             variable=self.switch_var,
             command=self.switch_callback,
         )
@@ -495,38 +616,126 @@ class SidebarPanel(customtkinter.CTkFrame):
         self.history_label = customtkinter.CTkLabel(
             top_frame,
             text="History(click)",
-            font=customtkinter.CTkFont(size=14, weight="bold"),
-            text_color="#D0BCFF",
+            font=shared_font(14, "bold"),
+            text_color=TEXT,
         )
         self.history_label.pack(side="top", padx=10)
 
-        # Scrollable history container
-        self.scrollable_history = customtkinter.CTkScrollableFrame(
+        # Filters the history as you type: an expression prefix, or
+        # "=low..high" for a range of results
+        self.search_text = customtkinter.StringVar()
+        search_entry = customtkinter.CTkEntry(
             self,
-            fg_color="#3A3B41",
+            placeholder_text="Search (=1..10 for results)",
+            textvariable=self.search_text,
+            text_color=TEXT,
+            fg_color=LIST,
         )
-        self.scrollable_history.pack(fill="both", expand=True)
+        search_entry.pack(pady=(0, 10), padx=10, fill="x")
+        self.search_text.trace_add("write", self.on_search)
+
+        # Opens the table window for tabulating an expression over x
+        table_btn = customtkinter.CTkButton(
+            self,
+            text="📈 Table",
+            fg_color=BUTTON,
+            height=40,
+            text_color=TEXT,
+            command=self.app.open_table,
+            hover_color=BUTTON_HOVER,
+            font=shared_font(16),
+        )
+        table_btn.pack(side="bottom", pady=10, padx=10, fill="x")
+
+        # History list: a fixed pool of row buttons reused while scrolling
+        history_frame = customtkinter.CTkFrame(self, fg_color=LIST)
+        history_frame.pack(fill="both", expand=True)
+        self.scrollbar = customtkinter.CTkScrollbar(
+            history_frame, command=self.on_scroll
+        )
+        self.scrollbar.pack(side="right", fill="y")
+        self.rows_frame = customtkinter.CTkFrame(history_frame, fg_color=LIST)
+        self.rows_frame.pack(side="left", fill="both", expand=True)
+
+        self.offset = 0
+        self.count = 0
+        self.shown_rows = 0
+        self.shown_entries = []
+        self.rows = []
+        for i in range(HISTORY_ROWS):
+            row = customtkinter.CTkButton(
+                self.rows_frame,
+                text="",
+                text_color=TEXT,
+                font=shared_font(18),
+                command=lambda i=i: self.row_onclick(i),
+                fg_color=LIST,
+                hover_color=LIST,
+            )
+            self.rows.append(row)
+
+        for widget in (self.rows_frame, *self.rows):
+            widget.bind("<MouseWheel>", self.on_mousewheel)
+            widget.bind("<Button-4>", lambda e: self.scroll_rows(-1))
+            widget.bind("<Button-5>", lambda e: self.scroll_rows(1))
 
     def print_history(self):
-        # Clear previous history entries
-        for widget in self.scrollable_history.winfo_children():
-            widget.destroy()
-
-        # Add new history entries
-        if self.calc_engine.history:
-            for expr, result in self.calc_engine.history:
-                copy_hist_btn = customtkinter.CTkButton(
-                    self.scrollable_history,
-                    text=f"{expr} = {result}",
-                    text_color="#D0BCFF",
-                    font=customtkinter.CTkFont(size=18),
-                    command=lambda e=expr, r=result, s=self.switch_var: self.expr_onclick(
-                        e, r, s
-                    ),
-                    fg_color="#3A3B41",
-                    hover_color="#3A3B41",
-                )
-                copy_hist_btn.pack(anchor="w", pady=2)
+        # A new entry was added; keep a scrolled view on the same entries
+        if self.offset:
+            self.offset += 1
+        if self.sidebar_visible:
+            self.render_rows()
+
+    def render_rows(self):
+        # Page the visible window of the (filtered) history in from the store
+        query = self.search_text.get()
+        count = self.history_store.count(query)
+        self.count = count
+        self.offset = max(0, min(self.offset, count - len(self.rows)))
+        self.shown_entries = self.history_store.page(self.offset, len(self.rows), query)
+        shown = len(self.shown_entries)
+
+        for row, (expr, result) in zip(self.rows, self.shown_entries):
+            row.configure(text=f"{expr} = {result}")
+
+        # Only pack or hide the rows whose visibility changed
+        for row in self.rows[self.shown_rows : shown]:
+            row.pack(anchor="w", pady=2)
+        for row in self.rows[shown : self.shown_rows]:
+            row.pack_forget()
+        self.shown_rows = shown
+
+        if count:
+            self.scrollbar.set(self.offset / count, (self.offset + shown) / count)
+        else:
+            self.scrollbar.set(0, 1)
+
+    def on_search(self, *args):
+        self.offset = 0
+        if self.sidebar_visible:
+            self.render_rows()
+
+    def scroll_rows(self, step):
+        self.offset += step
+        self.render_rows()
+
+    def on_scroll(self, action, amount, unit=None):
+        # Scrollbar callback: ("moveto", fraction) or ("scroll", n, units|pages)
+        if action == "moveto":
+            self.offset = int(float(amount) * self.count)
+            self.render_rows()
+        else:
+            step = int(amount)
+            if unit == "pages":
+                step *= len(self.rows)
+            self.scroll_rows(step)
+
+    def on_mousewheel(self, event):
+        self.scroll_rows(-1 if event.delta > 0 else 1)
+
+    def row_onclick(self, i):
+        expr, result = self.shown_entries[i]
+        self.expr_onclick(expr, result, self.switch_var)
 
     def expr_onclick(self, expr, result, switch):
         # Handle history item click based on switch state
@@ -551,6 +760,10 @@ class SidebarPanel(customtkinter.CTkFrame):
         else:
             self.pack(side="left", fill="y")
         self.sidebar_visible = not self.sidebar_visible
+
+        # Rows are only refreshed while visible, so catch up when shown
+        if self.sidebar_visible:
+            self.render_rows()
         self.update_window_size()
 
     def update_window_size(self):
@@ -562,23 +775,22 @@ class SidebarPanel(customtkinter.CTkFrame):
 
 
 class ControlFrame(customtkinter.CTkFrame):
-    def __init__(self, parent, display_frame, sidebar_frame, app):
-        super().__init__(parent, fg_color="#2A2B31")
+    def __init__(self, parent, display_frame, app):
+        super().__init__(parent, fg_color=PANEL)
         self.app = app
         self.display = display_frame
-        self.sidebar_frame = sidebar_frame
 
         # History toggle button
         history_btn = customtkinter.CTkButton(
             self,
             text="📜 history",
-            fg_color="#3E4C5A",
+            fg_color=BUTTON,
             width=67,
             height=60,
-            text_color="#D0BCFF",
-            command=self.sidebar_frame.toggle_sidebar,
-            hover_color="#2D3B4F",
-            font=customtkinter.CTkFont(size=17),
+            text_color=TEXT,
+            command=self.app.toggle_sidebar,
+            hover_color=BUTTON_HOVER,
+            font=shared_font(17),
         )
         history_btn.pack(side="right", padx=5)
 
@@ -587,12 +799,12 @@ class ControlFrame(customtkinter.CTkFrame):
             self,
             text="❌ Exit",
             command=self.app.destroy,
-            fg_color="#3E4C5A",
-            hover_color="#732027",
+            fg_color=BUTTON,
+            hover_color=EXIT_HOVER,
             width=67,
             height=60,
-            text_color="#D0BCFF",
-            font=customtkinter.CTkFont(size=17),
+            text_color=TEXT,
+            font=shared_font(17),
         )
         exit_btn.pack(side="left", padx=5)
 
@@ -600,13 +812,13 @@ class ControlFrame(customtkinter.CTkFrame):
         copy_btn = customtkinter.CTkButton(
             self,
             text="📋 Copy",
-            fg_color="#3E4C5A",
+            fg_color=BUTTON,
             width=67,
             height=60,
-            text_color="#D0BCFF",
+            text_color=TEXT,
             command=self.copy_entry_text,
-            hover_color="#2D3B4F",
-            font=customtkinter.CTkFont(size=16),
+            hover_color=BUTTON_HOVER,
+            font=shared_font(16),
         )
         copy_btn.pack(side="left", padx=5)
 
@@ -614,13 +826,13 @@ class ControlFrame(customtkinter.CTkFrame):
         back_btn = customtkinter.CTkButton(
             self,
             text="⌫",
-            fg_color="#3E4C5A",
+            fg_color=BUTTON,
             width=67,
             height=60,
-            text_color="#D0BCFF",
+            text_color=TEXT,
             command=self.display.some_clear,
-            hover_color="#2D3B4F",
-            font=customtkinter.CTkFont(size=25),
+            hover_color=BUTTON_HOVER,
+            font=shared_font(25),
         )
         back_btn.pack(side="right", padx=5)
 
@@ -628,24 +840,132 @@ class ControlFrame(customtkinter.CTkFrame):
         clear_btn = customtkinter.CTkButton(
             self,
             text="🧹 ",
-            fg_color="#3E4C5A",
+            fg_color=BUTTON,
             width=67,
             height=60,
-            text_color="#D0BCFF",
+            text_color=TEXT,
             command=self.display.clear_expression,
-            hover_color="#2D3B4F",
-            font=customtkinter.CTkFont(size=25),
+            hover_color=BUTTON_HOVER,
+            font=shared_font(25),
         )
         clear_btn.pack(side="right", padx=5)
 
     def copy_entry_text(self, event=None):
         # Copy current expression to system clipboard
         text = self.display.get_expression()
-        app.clipboard_clear()
-        app.clipboard_append(text)
-        app.update()
+        self.app.clipboard_clear()
+        self.app.clipboard_append(text)
+        self.app.update()
 
 
-# Initialize and run the application
-app = App()
-app.mainloop()
+class TableWindow(customtkinter.CTkToplevel):
+    # Evaluates an expression in x over a range and lists the results
+    def __init__(self, app, calc_engine):
+        super().__init__(app, fg_color=BACKGROUND)
+        self.calc_engine = calc_engine
+        self.title("Table")
+        self.geometry("400x550")
+
+        self.expr_text = customtkinter.StringVar(value="x")
+        self.range_text = customtkinter.StringVar(value="0:10:1")
+        inputs_frame = customtkinter.CTkFrame(self, fg_color=PANEL)
+        inputs_frame.pack(pady=10, padx=10, fill="x")
+        for row, (label, variable) in enumerate(
+            (("f(x) =", self.expr_text), ("x from:to:step", self.range_text))
+        ):
+            customtkinter.CTkLabel(
+                inputs_frame, text=label, text_color=TEXT
+            ).grid(row=row, column=0, padx=5, pady=5, sticky="w")
+            entry = customtkinter.CTkEntry(
+                inputs_frame,
+                textvariable=variable,
+                font=shared_font(16, family=MONO),
+                text_color=TEXT,
+                fg_color=FIELD,
+            )
+            entry.grid(row=row, column=1, padx=5, pady=5, sticky="ew")
+            entry.bind("<Return>", lambda e: self.show_table())
+        inputs_frame.grid_columnconfigure(1, weight=1)
+
+        run_btn = customtkinter.CTkButton(
+            self,
+            text="Tabulate",
+            fg_color=BUTTON,
+            height=40,
+            text_color=TEXT,
+            command=self.show_table,
+            hover_color=BUTTON_HOVER,
+            font=shared_font(16),
+        )
+        run_btn.pack(padx=10, fill="x")
+
+        self.output = customtkinter.CTkTextbox(
+            self,
+            font=shared_font(14, family=MONO),
+            text_color=TEXT,
+            fg_color=LIST,
+        )
+        self.output.pack(pady=10, padx=10, fill="both", expand=True)
+        self.show_table()
+
+    def show_table(self):
+        self.output.configure(state="normal")
+        self.output.delete("1.0", "end")
+        self.output.insert("end", self.table_text())
+        self.output.configure(state="disabled")
+
+    def table_text(self):
+        # NumPy is only needed once a table is requested
+        try:
+            from sweep import Sweep, parse_range, sweep_range
+        except ImportError:
+            return "Tables need NumPy: pip install numpy"
+
+        try:
+            # Only the rows shown are built, however long the range is
+            spec = self.range_text.get()
+            _, _, count = parse_range(spec)
+            sweep = Sweep(self.calc_engine, self.expr_text.get())
+            rows = list(sweep.table(sweep_range(spec, TABLE_ROWS)))
+        except Exception as e:
+            return f"Error: {e}"
+
+        lines = []
+        for value, result, error in rows:
+            if error is None:
+                try:
+                    text = format_result(result)
+                except OverflowError as e:
+                    text = f"Error: {e}"
+            else:
+                text = f"Error: {error}"
+            lines.append(f"{value:>12.10g}  {text}")
+        if count > TABLE_ROWS:
+            lines.append(f"… {count - TABLE_ROWS} more rows")
+        return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Calculator")
+    parser.add_argument(
+        "--trace-startup",
+        action="store_true",
+        help="print import, construction and first-frame times on stderr",
+    )
+    parser.add_argument(
+        "--exit-after-startup",
+        action="store_true",
+        help="with --trace-startup, close once the first frame is drawn",
+    )
+    args = parser.parse_args(argv)
+
+    # Initialize and run the application
+    trace = None
+    if args.trace_startup:
+        trace = StartupTrace(exit_when_drawn=args.exit_after_startup)
+    app = App(trace)
+    app.mainloop()
+
+
+if __name__ == "__main__":
+    main()
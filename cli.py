@@ -0,0 +1,265 @@
+import argparse
+import json
+import sys
+
+from engine import BACKENDS, Budget, Calculate, format_result
+from stream import CHUNK_SIZE, FORMATS, evaluate_file, evaluate_mapped_file
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        prog="calculator",
+        description="Evaluate expressions without starting the GUI.",
+    )
+    parser.add_argument(
+        "expressions",
+        nargs="*",
+        help="expressions to evaluate; read from stdin when omitted",
+    )
+    parser.add_argument(
+        "--gui", action="store_true", help="launch the graphical calculator"
+    )
+    parser.add_argument(
+        "--backend",
+        choices=BACKENDS,
+        default="float",
+        help="number type: float, exact int/fraction, decimal, "
+        "or auto (exact when possible)",
+    )
+    parser.add_argument(
+        "--precision",
+        type=int,
+        default=28,
+        help="significant digits for --backend decimal (default: %(default)s)",
+    )
+    limits = parser.add_argument_group("evaluation limits")
+    limits.add_argument("--max-tokens", type=int, help="tokens per expression")
+    limits.add_argument("--max-depth", type=int, help="parenthesis nesting depth")
+    limits.add_argument(
+        "--max-operations", type=int, help="operators per expression"
+    )
+    limits.add_argument("--max-exponent", type=float, help="largest '^' exponent")
+    limits.add_argument(
+        "--timeout", type=float, help="seconds allowed per expression"
+    )
+    parser.add_argument(
+        "--sweep",
+        metavar="VAR=START:STOP:STEP",
+        help="tabulate the expressions over VAR from START to STOP (needs NumPy)",
+    )
+    parser.add_argument(
+        "-f", "--file", help="stream expressions from a file ('-' for stdin)"
+    )
+    parser.add_argument(
+        "-o", "--output", help="write file results here instead of stdout"
+    )
+    parser.add_argument(
+        "--format",
+        choices=FORMATS,
+        default="text",
+        help="output format for --file and --sweep (default: text)",
+    )
+    parser.add_argument(
+        "--mmap",
+        action="store_true",
+        help="scan --file through a memory map instead of reading lines "
+        "(single process)",
+    )
+    parser.add_argument(
+        "-j",
+        "--workers",
+        type=int,
+        default=1,
+        help="worker processes for --file (0 uses every core)",
+    )
+    parser.add_argument(
+        "--chunk-size",
+        type=int,
+        default=CHUNK_SIZE,
+        help="lines per chunk for --file (default: %(default)s)",
+    )
+    parser.add_argument(
+        "--program-cache",
+        metavar="PATH",
+        help="keep parsed expressions in this file so later runs skip parsing",
+    )
+    parser.add_argument(
+        "--profile",
+        action="store_true",
+        help="print per-stage timings to stderr (single process only)",
+    )
+    parser.add_argument(
+        "--stats",
+        action="store_true",
+        help="print line count and throughput for --file to stderr",
+    )
+    return parser.parse_args(argv)
+
+
+def evaluate_lines(calc_engine, lines, out=sys.stdout, err=sys.stderr):
+    # Print one result per expression; 'ans' refers to the previous line
+    failed = 0
+    for line in lines:
+        expr = line.strip()
+        if not expr:
+            continue
+        try:
+            value = calc_engine.calc(calc_engine.simplify(expr))
+            result = format_result(value)
+        except Exception as e:
+            print(f"Error: {e}", file=err)
+            failed += 1
+            continue
+        calc_engine.add_to_history(expr, value)
+        print(result, file=out)
+    return failed
+
+
+def engine_options(args):
+    # Calculate keyword arguments shared by every evaluation mode
+    limits = {
+        "max_tokens": args.max_tokens,
+        "max_depth": args.max_depth,
+        "max_operations": args.max_operations,
+        "max_exponent": args.max_exponent,
+        "timeout": args.timeout,
+    }
+    # Budget checks are only paid for when a limit was given
+    budget = None
+    if any(value is not None for value in limits.values()):
+        budget = Budget(**limits)
+    return {
+        "backend": args.backend,
+        "precision": args.precision,
+        "budget": budget,
+        "program_cache": args.program_cache,
+    }
+
+
+def run_file(args):
+    binary = args.format == "bin"
+    if args.output:
+        mode = "wb" if binary else "w"
+        out = open(args.output, mode, **({} if binary else {"newline": ""}))
+    else:
+        out = sys.stdout.buffer if binary else sys.stdout
+
+    # Profiling needs the engine in this process
+    calc_engine = None
+    if args.profile:
+        args.workers = 1
+        calc_engine = Calculate(**engine_options(args))
+        calc_engine.enable_profiling()
+
+    try:
+        if args.mmap and args.file != "-" and args.workers == 1:
+            # Scan the mapped file in place instead of decoding each line
+            stats = evaluate_mapped_file(
+                args.file,
+                out,
+                args.format,
+                calc_engine=calc_engine,
+                options=engine_options(args),
+            )
+        else:
+            stats = evaluate_lines_file(args, out, calc_engine)
+    except OSError as e:
+        # A missing or unreadable input file, or a failed write
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if args.output:
+            out.close()
+
+    if args.stats:
+        print(stats.summary(), file=sys.stderr)
+    if calc_engine is not None:
+        print_profile(calc_engine)
+    return 1 if stats.errors else 0
+
+
+def evaluate_lines_file(args, out, calc_engine):
+    src = sys.stdin if args.file == "-" else open(args.file, encoding="utf-8")
+    try:
+        return evaluate_file(
+            src,
+            out,
+            args.format,
+            calc_engine=calc_engine,
+            chunk_size=args.chunk_size,
+            workers=args.workers or None,
+            options=engine_options(args),
+        )
+    finally:
+        if src is not sys.stdin:
+            src.close()
+
+
+def run_sweep(args):
+    # NumPy is only imported for table mode
+    from sweep import Sweep, sweep_range, write_table
+
+    variable, _, spec = args.sweep.partition("=")
+    if not args.expressions:
+        print("Error: --sweep needs at least one expression", file=sys.stderr)
+        return 1
+    calc_engine = Calculate(**engine_options(args))
+    try:
+        values = sweep_range(spec)
+        sweeps = [Sweep(calc_engine, expr, variable) for expr in args.expressions]
+    except Exception as e:
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+
+    binary = args.format == "bin"
+    if args.output:
+        mode = "wb" if binary else "w"
+        out = open(args.output, mode, **({} if binary else {"newline": ""}))
+    else:
+        out = sys.stdout.buffer if binary else sys.stdout
+    try:
+        errors = write_table(sweeps, values, out, args.format)
+    except Exception as e:
+        # Evaluation happens while the table is written, e.g. a missing
+        # 'ans' or an exceeded budget
+        print(f"Error: {e}", file=sys.stderr)
+        return 1
+    finally:
+        if args.output:
+            out.close()
+    return 1 if errors else 0
+
+
+def print_profile(calc_engine):
+    print(json.dumps(calc_engine.profiler.snapshot(), indent=2), file=sys.stderr)
+
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    # The GUI toolkit is only imported when the window is requested
+    if args.gui:
+        import calculator
+
+        # Not sys.argv: the GUI has options of its own and no --gui
+        calculator.main([])
+        return 0
+
+    if args.file:
+        return run_file(args)
+
+    if args.sweep:
+        return run_sweep(args)
+
+    lines = args.expressions or sys.stdin
+    calc_engine = Calculate(**engine_options(args))
+    if args.profile:
+        calc_engine.enable_profiling()
+    failed = evaluate_lines(calc_engine, lines)
+    if args.profile:
+        print_profile(calc_engine)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,211 @@
+import math
+import operator
+
+from engine import BUDGET_CHECK_INTERVAL, PRECEDENCE, is_array
+
+
+# Operator functions that can be emitted as plain Python operators
+INFIX = {operator.add: "+", operator.sub: "-", operator.mul: "*"}
+
+
+def check_variables(variables):
+    for name in variables:
+        if not name.isidentifier() or name == "ans" or name in PRECEDENCE:
+            raise ValueError(f"invalid variable name '{name}'")
+
+
+def compile_program(
+    calc_engine, program, variables=(), expr="<expression>", session=None
+):
+    # Returns a function taking one argument per variable, in order, that
+    # gives the same result (or raises the same error) as evaluating the
+    # program with those values; 'ans' comes from 'session' as in evaluate
+    if session is None:
+        session = calc_engine
+    function = build(
+        calc_engine,
+        session,
+        program,
+        variables,
+        expr,
+        calc_engine.operations,
+        calc_engine.negate,
+        calc_engine.coerce,
+    )
+    if calc_engine.fallback is None:
+        return function
+
+    # 'auto': retry in floating point when there is no exact result
+    fallback = calc_engine.fallback
+    float_function = build(
+        calc_engine,
+        session,
+        [node if node.__class__ is str else float(node) for node in program],
+        variables,
+        expr,
+        calc_engine.float_operations,
+        operator.neg,
+        float,
+    )
+
+    def compiled(*args):
+        try:
+            return function(*args)
+        except fallback:
+            return float_function(*args)
+
+    compiled.source = function.source
+    return compiled
+
+
+def build(calc_engine, session, program, variables, expr, operations, negate, coerce):
+    infix = dict(INFIX)
+    infix[calc_engine.add] = "+"
+    infix[calc_engine.sub] = "-"
+    infix[calc_engine.mul] = "*"
+    budget = calc_engine.budget
+
+    # Values the generated code refers to by name
+    bindings = {
+        "engine": calc_engine,
+        "session": session,
+        "coerce": coerce,
+        "negate": negate,
+    }
+    names = {}
+
+    def bind(value, prefix):
+        key = (prefix, id(value))
+        if key not in names:
+            names[key] = f"{prefix}{len(names)}"
+            bindings[names[key]] = value
+        return names[key]
+
+    def source(operand):
+        is_constant, value = operand
+        if not is_constant:
+            return value
+        if value.__class__ is int or (
+            value.__class__ is float and math.isfinite(value)
+        ):
+            text = repr(value)
+            return f"({text})" if text[0] == "-" else text
+        return bind(value, "k")
+
+    # Arguments are converted like literals of the backend
+    lines = []
+    for i in range(len(variables)):
+        if coerce is float:
+            lines.append(f"if v{i}.__class__ is not float:")
+            lines.append(f"    v{i} = float(v{i})")
+        else:
+            lines.append(f"v{i} = coerce(v{i})")
+    lines += [
+        "budget = engine.budget",
+        "if budget is not None:",
+        "    deadline = budget.deadline()",
+        "    budget.check_time(deadline)",
+    ]
+    # Stack of (is_constant, value or name); constant operands are folded
+    stack = []
+    temps = 0
+    ans_loaded = False
+
+    for node in program:
+        if node.__class__ is not str:
+            stack.append((True, node))
+            continue
+        if node in variables:
+            stack.append((False, f"v{variables.index(node)}"))
+            continue
+        if node == "ans":
+            if not ans_loaded:
+                lines.append("ans = session.resolve_ans(coerce)")
+                # The inlined float checks below only work on numbers
+                if coerce is float:
+                    lines.append("if ans.__class__ is not float:")
+                    lines.append(
+                        "    raise ValueError(\"compiled expressions need a "
+                        "number for 'ans'\")"
+                    )
+                ans_loaded = True
+            stack.append((False, "ans"))
+            continue
+
+        temp = f"t{temps}"
+        temps += 1
+        if temps % BUDGET_CHECK_INTERVAL == 0:
+            lines.append("if budget is not None:")
+            lines.append("    budget.check_time(deadline)")
+
+        if node == "neg":
+            operand = stack.pop()
+            if operand[0]:
+                stack.append((True, negate(operand[1])))
+                continue
+            if negate is operator.neg:
+                lines.append(f"{temp} = -{operand[1]}")
+            else:
+                lines.append(f"{temp} = negate({operand[1]})")
+            stack.append((False, temp))
+            continue
+
+        right = stack.pop()
+        left = stack.pop()
+        func = operations[node]
+
+        # Fold constant operands now; anything that fails is left to run
+        # time so the error is raised when the function is called
+        if left[0] and right[0]:
+            try:
+                if node == "^" and budget is not None:
+                    budget.check_exponent(right[1])
+                stack.append((True, func(left[1], right[1])))
+                continue
+            except Exception:
+                pass
+
+        a = source(left)
+        b = source(right)
+        if node == "^":
+            lines.append("if budget is not None:")
+            lines.append(f"    budget.check_exponent({b})")
+
+        # Vector constants go through the checked backend functions
+        vector = is_array(left[1]) or is_array(right[1])
+
+        if func in infix:
+            lines.append(f"{temp} = {a} {infix[func]} {b}")
+        elif func == calc_engine.div and not vector:
+            # Same check as Calculate.div, skipped for a safe constant
+            if not (right[0] and abs(right[1]) >= 1e-15):
+                lines.append(f"if abs({b}) < 1e-15:")
+                lines.append('    raise ZeroDivisionError("division by zero")')
+            lines.append(f"{temp} = {a} / {b}")
+        elif func == calc_engine.pows and not vector:
+            lines.append(f"{temp} = {a} ** {b}")
+            # Only a negative base with a fractional exponent can go complex
+            if not (left[0] and left[1] >= 0) and not (
+                right[0] and float(right[1]).is_integer()
+            ):
+                lines.append(f"if {temp}.__class__ is complex:")
+                lines.append('    raise ValueError("math domain error")')
+        else:
+            lines.append(f"{temp} = {bind(func, 'f')}({a}, {b})")
+        stack.append((False, temp))
+
+    lines.append(f"return {source(stack[0])}")
+
+    params = ", ".join(f"v{i}" for i in range(len(variables)))
+    body = "\n".join(f"        {line}" for line in lines)
+    text = (
+        f"def factory({', '.join(bindings)}):\n"
+        f"    def compiled({params}):\n"
+        f"{body}\n"
+        f"    return compiled\n"
+    )
+    namespace = {}
+    exec(compile(text, f"<compiled {expr}>", "exec"), namespace)
+    function = namespace["factory"](**bindings)
+    function.source = text
+    return function
@@ -0,0 +1,964 @@
+import operator
+import re
+import sys
+import time
+from array import array
+from collections import OrderedDict
+from itertools import accumulate, repeat
+
+
+MAX_NUMBER = 1e25
+
+# Numeric backends accepted by Calculate; all but "float" live in numeric.py
+BACKENDS = ("float", "exact", "decimal", "auto")
+
+# Numbers (with optional fraction and exponent), names such as 'ans',
+# operators, parentheses and the brackets and commas of vector literals; any
+# other non-space character lands in the last group. ASCII only, as in the
+# byte-level reader of mapped files, so digits such as '٣' are rejected.
+TOKEN_PATTERN = re.compile(
+    r"\s*(?:(\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)"
+    r"|([A-Za-z_]\w*)|([-+*/^()@\[\],])|(\S))",
+    re.ASCII,
+)
+
+# Prefixes of a number or 'ans' that may still grow while being typed
+PARTIAL_TOKEN_PATTERN = re.compile(
+    r"\d+\.?\d*(?:[eE][+-]?\d*)?|\.\d*(?:[eE][+-]?\d*)?|a|an|ans", re.ASCII
+)
+
+# Whitespace the tokenizer ignores. A run is kept, as one space, only where
+# removing it could join two tokens: between name or number characters, or
+# around the sign after an 'e', as in '1e +5' or '1e+ 5'.
+SPACE_PATTERN = re.compile(
+    r"((?<=[\w.])\s+(?=[\w.])|(?<=[eE])\s+(?=[-+])|(?<=[eE][-+])\s+(?=[\w.]))"
+    r"|\s+",
+    re.ASCII,
+)
+
+# Binding strength of operators; "neg" is unary minus and "@" the matrix
+# product
+PRECEDENCE = {"+": 1, "-": 1, "*": 2, "/": 2, "@": 2, "^": 3, "neg": 4}
+
+# Nesting change per token, used to measure parenthesis depth
+PAREN_DEPTH = {"(": 1, ")": -1}
+
+# Stage names and the Calculate methods timed under them when profiling
+PROFILED_STAGES = {
+    "tokenize": "parse_expr",
+    "simplify": "simplify",
+    "parse": "parse",
+    "evaluate": "evaluate",
+    "calc": "calc",
+}
+
+# Nodes evaluated between deadline and cancellation checks
+BUDGET_CHECK_INTERVAL = 256
+
+# Results kept per session unless asked otherwise
+SESSION_HISTORY = 1_000
+
+
+def paren_depth(tokens):
+    return max(accumulate(map(PAREN_DEPTH.get, tokens, repeat(0))), default=0)
+
+
+def operation_count(tokens):
+    return sum(map(tokens.count, "+-*/^@"))
+
+
+def cache_key(expr):
+    # Expression text with insignificant whitespace removed, so '1 + 2' and
+    # '1+2' share a cache entry. Tabs and line breaks are not printable, so
+    # text without a space usually skips the substitution.
+    if " " not in expr and expr.isprintable():
+        return expr
+    return SPACE_PATTERN.sub(lambda match: " " if match.group(1) else "", expr)
+
+
+def is_array(value):
+    # NumPy arrays made from vector literals; numpy itself is only imported
+    # by vectors.py, once a literal is read
+    return getattr(value, "ndim", 0) > 0
+
+
+class BudgetExceeded(Exception):
+    def __init__(self, limit, message):
+        super().__init__(message)
+        self.limit = limit
+
+    # Errors cross process boundaries with the worker pool's results
+    def __reduce__(self):
+        return self.__class__, (self.limit, str(self))
+
+
+class Budget:
+    # Limits for one evaluation; None disables a limit. The timeout is in
+    # seconds and applies to each evaluation separately.
+    def __init__(
+        self,
+        max_tokens=None,
+        max_depth=None,
+        max_operations=None,
+        max_exponent=None,
+        timeout=None,
+    ):
+        self.max_tokens = max_tokens
+        self.max_depth = max_depth
+        self.max_operations = max_operations
+        self.max_exponent = max_exponent
+        self.timeout = timeout
+        self.cancelled = False
+
+    def cancel(self):
+        # Abort the running evaluation and any later ones until reset()
+        self.cancelled = True
+
+    def reset(self):
+        self.cancelled = False
+
+    def check_tokens(self, tokens):
+        # Limits that can be checked before evaluating anything
+        if self.max_tokens is not None and len(tokens) > self.max_tokens:
+            raise BudgetExceeded(
+                "tokens", f"expression has too many tokens (limit {self.max_tokens})"
+            )
+        # Depth can only exceed the limit if there are enough parentheses
+        if self.max_depth is not None and tokens.count("(") > self.max_depth:
+            if paren_depth(tokens) > self.max_depth:
+                raise BudgetExceeded(
+                    "depth", f"expression is nested too deeply (limit {self.max_depth})"
+                )
+        if self.max_operations is not None:
+            if operation_count(tokens) > self.max_operations:
+                raise BudgetExceeded(
+                    "operations",
+                    f"expression has too many operations (limit {self.max_operations})",
+                )
+
+    def check_exponent(self, exponent):
+        if self.max_exponent is None:
+            return
+        if is_array(exponent):
+            exponent = abs(exponent).max()
+        if abs(exponent) > self.max_exponent:
+            raise BudgetExceeded(
+                "exponent", f"exponent is too large (limit {self.max_exponent})"
+            )
+
+    def deadline(self):
+        return None if self.timeout is None else time.monotonic() + self.timeout
+
+    def check_time(self, deadline):
+        if self.cancelled:
+            raise BudgetExceeded("cancelled", "evaluation cancelled")
+        if deadline is not None and time.monotonic() > deadline:
+            raise BudgetExceeded("timeout", f"timed out after {self.timeout}s")
+
+
+class CacheEntry:
+    __slots__ = ("program", "value", "uses_ans")
+
+    def __init__(self, program, uses_ans):
+        self.program = program
+        self.value = None
+        self.uses_ans = uses_ans
+
+
+class ExpressionCache:
+    # Shared by every session of an engine. Lookups take no lock, so under
+    # several threads the size may briefly pass max_entries and the counters
+    # are approximate.
+    def __init__(self, max_entries=256, policy="lru"):
+        if policy not in ("lru", "fifo"):
+            raise ValueError(f"unknown eviction policy '{policy}'")
+        self.max_entries = max_entries
+        self.policy = policy
+        self.entries = OrderedDict()
+        # Keys whose cached value depends on the last answer
+        self.ans_keys = set()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    def get(self, key):
+        entry = self.entries.get(key)
+        if entry is not None and self.policy == "lru":
+            try:
+                self.entries.move_to_end(key)
+            except KeyError:
+                # Evicted by another thread since the lookup
+                pass
+        return entry
+
+    def put(self, key, program):
+        # Not 'in': vector constants do not compare to strings
+        uses_ans = any(node.__class__ is str and node == "ans" for node in program)
+        entry = CacheEntry(program, uses_ans)
+        if self.max_entries <= 0:
+            return entry
+
+        # Evict the oldest entry once the cache is full
+        if len(self.entries) >= self.max_entries:
+            try:
+                old_key, _ = self.entries.popitem(last=False)
+            except KeyError:
+                # Emptied by another thread
+                pass
+            else:
+                self.ans_keys.discard(old_key)
+                self.evictions += 1
+
+        self.entries[key] = entry
+        if entry.uses_ans:
+            self.ans_keys.add(key)
+        return entry
+
+    def invalidate_ans(self):
+        # Drop cached values that used the old answer, keep their parse
+        for key in tuple(self.ans_keys):
+            entry = self.entries.get(key)
+            if entry is not None and entry.value is not None:
+                entry.value = None
+                self.invalidations += 1
+
+    def clear(self):
+        self.entries.clear()
+        self.ans_keys.clear()
+
+    def stats(self):
+        return {
+            "size": len(self.entries),
+            "max_entries": self.max_entries,
+            "policy": self.policy,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "invalidations": self.invalidations,
+        }
+
+
+class History:
+    # Fixed-capacity ring buffer: results in a float64 array, expressions as
+    # interned strings; indexing and iteration are newest-first. Exact,
+    # decimal and vector results are kept alongside in a list created on
+    # first use, as the objects themselves.
+    def __init__(self, capacity=10_000):
+        if capacity < 1:
+            raise ValueError("history capacity must be positive")
+        self.capacity = capacity
+        self.results = array("d", bytes(8 * capacity))
+        self.exprs = [None] * capacity
+        self.exact = None
+        self.head = 0
+        self.count = 0
+
+    def append(self, expr, result):
+        head = self.head
+        self.exprs[head] = sys.intern(expr)
+        if result.__class__ is float:
+            self.results[head] = result
+            if self.exact is not None:
+                self.exact[head] = None
+        else:
+            if self.exact is None:
+                self.exact = [None] * self.capacity
+            self.exact[head] = result
+            if is_array(result):
+                self.results[head] = float("nan")
+            else:
+                try:
+                    self.results[head] = float(result)
+                except OverflowError:
+                    self.results[head] = float("inf")
+        self.head = head + 1 if head + 1 < self.capacity else 0
+        if self.count < self.capacity:
+            self.count += 1
+
+    def slot(self, index):
+        # Map a newest-first index to its position in the buffers
+        if index < 0:
+            index += self.count
+        if not 0 <= index < self.count:
+            raise IndexError("history index out of range")
+        return (self.head - 1 - index) % self.capacity
+
+    def value(self, slot):
+        if self.exact is not None and self.exact[slot] is not None:
+            return self.exact[slot]
+        return self.results[slot]
+
+    def last_result(self):
+        return self.value(self.slot(0))
+
+    def __len__(self):
+        return self.count
+
+    def __getitem__(self, index):
+        slot = self.slot(index)
+        return self.exprs[slot], format_result(self.value(slot))
+
+    def __iter__(self):
+        exprs = self.exprs
+        slot = self.head
+        for _ in range(self.count):
+            slot = slot - 1 if slot else self.capacity - 1
+            yield exprs[slot], format_result(self.value(slot))
+
+    def clear(self):
+        self.head = 0
+        self.count = 0
+        self.exprs = [None] * self.capacity
+        self.exact = None
+
+
+class Calculate:
+    # Backend, parser, caches and evaluation, safe to share between threads
+    # through sessions (see Session). Its own history serves single-user
+    # callers such as the GUI and the command line.
+    def __init__(
+        self,
+        cache_size=256,
+        cache_policy="lru",
+        history_size=10_000,
+        backend="float",
+        precision=28,
+        budget=None,
+        program_cache=None,
+    ):
+        # Map operators to their corresponding functions
+        self.float_operations = {
+            "+": self.add,
+            "-": self.sub,
+            "*": self.mul,
+            "/": self.div,
+            "^": self.pows,
+            "@": self.matmul,
+        }
+
+        # Numeric backend: how literals are read and operators applied
+        self.backend = backend
+        self.fallback = None
+        if backend == "float":
+            self.operations = self.float_operations
+            self.number = float
+            self.coerce = float
+            self.negate = operator.neg
+        else:
+            # Exact and decimal arithmetic are only imported when selected
+            import numeric
+
+            numbers = numeric.make_backend(backend, precision)
+            self.operations = dict(numbers.operations, **{"@": self.matmul})
+            self.number = numbers.number
+            self.coerce = numbers.coerce
+            self.negate = numbers.negate
+            # 'auto' stays exact when it can and falls back to float otherwise
+            if backend == "auto":
+                self.fallback = numeric.InexactResult
+
+        self.history = History(history_size)
+        self.cache = ExpressionCache(cache_size, cache_policy)
+        self.budget = budget
+        self.profiler = None
+
+        # Parsed programs kept in a file between runs; only imported when a
+        # path is given
+        self.program_cache = None
+        if program_cache is not None:
+            from program_cache import ProgramCache
+
+            self.program_cache = ProgramCache(program_cache, self)
+
+    # History management methods
+    def add_to_history(self, expr, result):
+        if result.__class__ is str:
+            result = float(result)
+        last_ans = self.get_last_ans()
+        if is_array(result) or is_array(last_ans):
+            changed = result is not last_ans
+        else:
+            changed = result != last_ans
+        self.history.append(expr, result)
+        if changed:
+            self.cache.invalidate_ans()
+
+    def get_last_ans(self):
+        return self.history.last_result() if self.history else "empty"
+
+    # Separate history and 'ans' for one user of a shared engine
+    def session(self, history_size=SESSION_HISTORY):
+        return Session(self, history_size)
+
+    # Opt-in per-stage instrumentation; nothing is wrapped while disabled
+    def enable_profiling(self, trace_memory=False, log_interval=None):
+        from profiling import OPERATOR_STAGES, StageProfiler
+
+        self.disable_profiling()
+        profiler = StageProfiler(trace_memory, log_interval)
+
+        # Instance attributes shadow the methods until profiling is disabled
+        for stage, name in PROFILED_STAGES.items():
+            setattr(self, name, profiler.wrap(stage, getattr(self, name)))
+
+        def wrap_operations(operations):
+            return {
+                op: profiler.wrap(OPERATOR_STAGES[op], func)
+                for op, func in operations.items()
+            }
+
+        self.unprofiled = (self.operations, self.float_operations)
+        self.float_operations = wrap_operations(self.float_operations)
+        if self.operations is self.unprofiled[1]:
+            self.operations = self.float_operations
+        else:
+            self.operations = wrap_operations(self.operations)
+
+        self.profiler = profiler
+        return profiler
+
+    def disable_profiling(self):
+        if self.profiler is None:
+            return
+        for name in PROFILED_STAGES.values():
+            del self.__dict__[name]
+        self.operations, self.float_operations = self.unprofiled
+        self.profiler.close()
+        self.profiler = None
+
+    # Basic arithmetic operations
+    def add(self, a, b):
+        return a + b
+
+    def sub(self, a, b):
+        return a - b
+
+    def mul(self, a, b):
+        return a * b
+
+    def div(self, a, b):
+        if a.__class__ is not float or b.__class__ is not float:
+            if is_array(a) or is_array(b):
+                return self.vector_operation("/", a, b)
+        # Check for division by zero with floating point precision
+        if abs(b) < 1e-15:
+            raise ZeroDivisionError("division by zero")
+        return a / b
+
+    def pows(self, a, b):
+        if a.__class__ is not float or b.__class__ is not float:
+            if is_array(a) or is_array(b):
+                return self.vector_operation("^", a, b)
+        result = a**b
+        # Negative base with fractional exponent has no real result
+        if result.__class__ is complex:
+            raise ValueError("math domain error")
+        return result
+
+    def matmul(self, a, b):
+        # Matrix product; plain numbers have none
+        if not (is_array(a) and is_array(b)):
+            raise ValueError("'@' needs a vector or matrix on both sides")
+        return self.vector_operation("@", a, b)
+
+    # Vectors and matrices check every element for the errors a scalar
+    # would raise; '+', '-' and '*' broadcast without any check
+    def vector_operation(self, op, a, b):
+        import vectors
+
+        return vectors.OPERATIONS[op](a, b)
+
+    # Resolve the 'ans' keyword to the last stored result
+    def resolve_ans(self, coerce=None):
+        last_ans = self.get_last_ans()
+        if last_ans.__class__ is str:
+            raise ValueError("no previous answer")
+        if is_array(last_ans):
+            return last_ans
+        return (coerce or self.coerce)(last_ans)
+
+    # Expression parsing: convert string to tokens
+    def parse_expr(self, expr: str, variables=()) -> list:
+        # Numbers are read by the backend; operators, parentheses, 'ans' and
+        # the given variable names stay strings
+        to_number = self.number
+        tokens = []
+        for number, name, op, other in TOKEN_PATTERN.findall(expr):
+            if number:
+                tokens.append(to_number(number))
+            elif op:
+                tokens.append(op)
+            elif name:
+                if name != "ans" and name not in variables:
+                    raise ValueError(f"unknown name '{name}'")
+                tokens.append(name)
+            else:
+                raise ValueError(f"unexpected character '{other}'")
+        return tokens
+
+    # Cheap cost estimate from the tokens alone, without evaluating
+    def estimate_cost(self, expr: str) -> dict:
+        tokens = self.parse_expr(expr)
+        return {
+            "tokens": len(tokens),
+            "depth": paren_depth(tokens),
+            "operations": operation_count(tokens),
+        }
+
+    # Operator-precedence parsing: build a postfix node list in one pass
+    # Names in 'variables' are left in the program for the caller to bind
+    def parse(self, expr: str, variables=()) -> list:
+        if self.program_cache is not None:
+            return self.program_cache.parse(expr, variables)
+        return self.parse_tokens(self.parse_expr(expr, variables), variables)
+
+    # Build the program from a token list, as made by parse_expr or by the
+    # scanner over mapped files
+    def parse_tokens(self, tokens: list, variables=()) -> list:
+        program = []
+        stack = []
+        expect_operand = True
+
+        if self.budget is not None:
+            self.budget.check_tokens(tokens)
+
+        # An iterator, so vector literals can read their elements from it
+        tokens = iter(tokens)
+        for token in tokens:
+            if expect_operand:
+                if token.__class__ is not str:
+                    # Fold unary minus directly applied to a number
+                    while stack and stack[-1] == "neg":
+                        stack.pop()
+                        token = self.negate(token)
+                    program.append(token)
+                    expect_operand = False
+                elif token == "ans" or token in variables:
+                    program.append(token)
+                    expect_operand = False
+                elif token == "-":
+                    stack.append("neg")
+                elif token == "(":
+                    stack.append(token)
+                elif token == ")" and stack and stack[-1] == "(":
+                    # Skip empty parentheses
+                    stack.pop()
+                elif token == "[":
+                    program.append(self.read_array(tokens))
+                    expect_operand = False
+                else:
+                    raise ValueError(f"unexpected '{token}'")
+
+            elif token == ")":
+                while stack and stack[-1] != "(":
+                    program.append(stack.pop())
+                if not stack:
+                    raise ValueError("unbalanced parentheses")
+                stack.pop()
+
+            elif token in PRECEDENCE:
+                # Pop operators that bind at least as tightly ('^' is right-associative)
+                precedence = PRECEDENCE[token]
+                while stack and stack[-1] != "(":
+                    top = PRECEDENCE[stack[-1]]
+                    if top < precedence or (top == precedence and token == "^"):
+                        break
+                    program.append(stack.pop())
+                stack.append(token)
+                expect_operand = True
+
+            else:
+                raise ValueError(f"unexpected '{token}'")
+
+        if expect_operand:
+            raise ValueError("incomplete expression")
+
+        # Remaining open parentheses are closed automatically
+        while stack:
+            op = stack.pop()
+            if op != "(":
+                program.append(op)
+        return program
+
+    # Vector and matrix literals: the tokens after '[' up to its ']' become
+    # one constant NumPy array in the program
+    def read_array(self, tokens):
+        if self.number is not float:
+            raise ValueError("vectors need the float backend")
+        import vectors
+
+        return vectors.array_literal(self.read_elements(tokens))
+
+    def read_elements(self, tokens):
+        # Numbers, optionally negated, or nested rows of a matrix
+        elements = []
+        for token in tokens:
+            negative = False
+            while token == "-":
+                negative = not negative
+                token = next(tokens, None)
+            if token == "[" and not negative:
+                elements.append(self.read_elements(tokens))
+            elif token is not None and token.__class__ is not str:
+                elements.append(-token if negative else token)
+            else:
+                raise ValueError("vector elements must be numbers")
+
+            token = next(tokens, None)
+            if token == "]":
+                return elements
+            if token != ",":
+                break
+        raise ValueError("expected ',' or ']' in vector")
+
+    # Evaluate a postfix node list with a value stack; 'ans' is read from
+    # 'session' (a Session, or this engine's own history when None). A
+    # 'budget' given here replaces the engine's for this evaluation only.
+    def evaluate(self, program: list, session=None, budget=None):
+        if budget is None:
+            budget = self.budget
+        run = self.run if budget is None else self.run_limited
+        if session is None:
+            session = self
+        operations = self.operations
+        if self.fallback is None:
+            return run(program, operations, self.negate, self.coerce, session, budget)
+        try:
+            return run(program, operations, self.negate, self.coerce, session, budget)
+        except self.fallback:
+            # No exact result; redo the calculation in floating point
+            program = [
+                node if node.__class__ is str else float(node) for node in program
+            ]
+            operations = self.float_operations
+            return run(program, operations, operator.neg, float, session, budget)
+
+    def run(self, program, operations, negate, coerce, session, budget=None):
+        stack = []
+        ans = None
+
+        for node in program:
+            if node.__class__ is not str:
+                stack.append(node)
+            elif node == "neg":
+                stack[-1] = negate(stack[-1])
+            elif node == "ans":
+                if ans is None:
+                    ans = session.resolve_ans(coerce)
+                stack.append(ans)
+            else:
+                right = stack.pop()
+                stack[-1] = operations[node](stack[-1], right)
+        return stack[0]
+
+    # Same as run, checking the exponent cap, deadline and cancellation
+    def run_limited(self, program, operations, negate, coerce, session, budget):
+        deadline = budget.deadline()
+        stack = []
+        ans = None
+
+        for index, node in enumerate(program):
+            if not index % BUDGET_CHECK_INTERVAL:
+                budget.check_time(deadline)
+            if node.__class__ is not str:
+                stack.append(node)
+            elif node == "neg":
+                stack[-1] = negate(stack[-1])
+            elif node == "ans":
+                if ans is None:
+                    ans = session.resolve_ans(coerce)
+                stack.append(ans)
+            else:
+                right = stack.pop()
+                if node == "^":
+                    budget.check_exponent(right)
+                stack[-1] = operations[node](stack[-1], right)
+        return stack[0]
+
+    # Main calculation method
+
+    def calc(self, expr: str, budget=None) -> float:
+        cache = self.cache
+        key = cache_key(expr)
+        entry = cache.get(key)
+        if entry is None:
+            entry = cache.put(key, self.parse(key))
+
+        # Reuse the cached value unless it was invalidated by a new answer
+        if entry.value is None:
+            cache.misses += 1
+            entry.value = self.evaluate(entry.program, None, budget)
+        else:
+            cache.hits += 1
+        return entry.value
+
+    # Compiled tier: lower an expression to a Python function taking one
+    # argument per variable, for expressions evaluated many times
+    def compile(self, expr: str, variables=(), session=None):
+        # Code generation is only imported when something is compiled
+        import codegen
+
+        codegen.check_variables(variables)
+        program = self.parse(self.simplify(expr), variables)
+        return codegen.compile_program(self, program, variables, expr, session)
+
+    # Batch calculation: one (result, error) pair per input, in order
+    def calc_many(self, exprs, session=None) -> list:
+        parse = self.parse
+        evaluate = self.evaluate
+        # Identical inputs in the batch share one parse and one result
+        seen = {}
+        results = []
+
+        for expr in exprs:
+            outcome = seen.get(expr)
+            if outcome is None:
+                try:
+                    outcome = (evaluate(parse(expr), session), None)
+                except Exception as e:
+                    outcome = (None, e)
+                seen[expr] = outcome
+            results.append(outcome)
+        return results
+
+    # Expression preprocessing: normalize text and auto-close parentheses
+
+    def simplify(self, expr: str) -> str:
+        expr = expr.strip()
+        open_count = expr.count("(")
+        close_count = expr.count(")")
+        if open_count > close_count:
+            expr += ")" * (open_count - close_count)
+        return expr
+
+
+class Session:
+    # Per-user state on a shared engine: the history, and with it 'ans'.
+    # Parsing, the expression cache, compiled code and the backend stay on
+    # the engine, which a session only reads, so any number of sessions can
+    # calculate at once from different threads without taking a lock.
+    # Anything not defined here, such as parse or budget, is the engine's.
+    def __init__(self, calc_engine, history_size=SESSION_HISTORY):
+        self.calc_engine = calc_engine
+        self.history = History(history_size)
+
+    def __getattr__(self, name):
+        return getattr(self.calc_engine, name)
+
+    def add_to_history(self, expr, result):
+        if result.__class__ is str:
+            result = float(result)
+        self.history.append(expr, result)
+
+    # Same as the engine's, on this session's history
+    get_last_ans = Calculate.get_last_ans
+    resolve_ans = Calculate.resolve_ans
+
+    def evaluate(self, program: list, budget=None):
+        return self.calc_engine.evaluate(program, self, budget)
+
+    def calc(self, expr: str, budget=None):
+        calc_engine = self.calc_engine
+        cache = calc_engine.cache
+        key = cache_key(expr)
+        entry = cache.get(key)
+        if entry is None:
+            entry = cache.put(key, calc_engine.parse(key))
+
+        # A value that used 'ans' belongs to one session and is not kept;
+        # any other value is the same for every session and is shared
+        value = None if entry.uses_ans else entry.value
+        if value is None:
+            cache.misses += 1
+            value = calc_engine.evaluate(entry.program, self, budget)
+            if not entry.uses_ans:
+                entry.value = value
+        else:
+            cache.hits += 1
+        return value
+
+    def calc_many(self, exprs) -> list:
+        return self.calc_engine.calc_many(exprs, self)
+
+    def compile(self, expr: str, variables=()):
+        return self.calc_engine.compile(expr, variables, self)
+
+
+def common_prefix(a: str, b: str) -> int:
+    # Length of the shared prefix, found by bisection so the characters are
+    # compared in C rather than one by one; keeps a backspace at the end of a
+    # long expression from costing a Python loop over all of it
+    low, high = 0, min(len(a), len(b))
+    # Deleting from the end leaves one a prefix of the other
+    if a[:high] == b[:high]:
+        return high
+    while low < high:
+        middle = (low + high + 1) // 2
+        if a.startswith(b[:middle]):
+            low = middle
+        else:
+            high = middle - 1
+    return low
+
+
+class IncrementalEvaluator:
+    # Evaluates an expression while it is typed. One state is kept per
+    # character, with value and operator stacks as shared linked tuples, so
+    # appending or deleting a character only touches the tail.
+    def __init__(self, calc_engine):
+        self.calc_engine = calc_engine
+        self.clear()
+
+    def clear(self):
+        self.text = ""
+        # (values, operators, expect_operand, pending token, error)
+        self.states = [(None, None, True, "", None)]
+
+    def sync(self, text: str):
+        # Reuse the states of the longest common prefix with the current text
+        if not text.startswith(self.text):
+            common = common_prefix(text, self.text)
+            del self.states[common + 1 :]
+            self.text = self.text[:common]
+        for char in text[len(self.text) :]:
+            self.states.append(self.feed(self.states[-1], char))
+        self.text = text
+
+    def apply(self, values, op):
+        if op == "neg":
+            return (self.calc_engine.negate(values[0]), values[1])
+        right, (left, rest) = values[0], values[1]
+        return (self.calc_engine.operations[op](left, right), rest)
+
+    def push_token(self, values, ops, text):
+        if text[0] != "a":
+            token = self.calc_engine.number(text)
+        elif text == "ans":
+            token = self.calc_engine.resolve_ans()
+        else:
+            raise ValueError(f"unexpected character '{text[0]}'")
+        return (token, values), ops
+
+    def feed(self, state, char):
+        values, ops, expect_operand, pending, error = state
+        if error is not None:
+            return state
+        try:
+            if pending:
+                if PARTIAL_TOKEN_PATTERN.fullmatch(pending + char):
+                    return values, ops, expect_operand, pending + char, None
+                # The pending token is complete
+                values, ops = self.push_token(values, ops, pending)
+                expect_operand = False
+
+            if char.isspace():
+                return values, ops, expect_operand, "", None
+
+            if PARTIAL_TOKEN_PATTERN.fullmatch(char):
+                if not expect_operand:
+                    raise ValueError(f"unexpected '{char}'")
+                return values, ops, expect_operand, char, None
+
+            if expect_operand:
+                if char == "-":
+                    ops = ("neg", ops)
+                elif char == "(":
+                    ops = (char, ops)
+                elif char == ")" and ops and ops[0] == "(":
+                    # Skip empty parentheses
+                    ops = ops[1]
+                else:
+                    raise ValueError(f"unexpected '{char}'")
+
+            elif char == ")":
+                while ops and ops[0] != "(":
+                    values = self.apply(values, ops[0])
+                    ops = ops[1]
+                if not ops:
+                    raise ValueError("unbalanced parentheses")
+                ops = ops[1]
+
+            elif char in PRECEDENCE:
+                precedence = PRECEDENCE[char]
+                while ops and ops[0] != "(":
+                    top = PRECEDENCE[ops[0]]
+                    if top < precedence or (top == precedence and char == "^"):
+                        break
+                    values = self.apply(values, ops[0])
+                    ops = ops[1]
+                ops = (char, ops)
+                expect_operand = True
+
+            else:
+                raise ValueError(f"unexpected '{char}'")
+
+        except Exception as e:
+            return values, ops, expect_operand, pending, e
+        return values, ops, expect_operand, "", None
+
+    def preview(self):
+        # Result of the current text with open parentheses closed, as a
+        # (value, error) pair; value is None while the expression is incomplete
+        values, ops, expect_operand, pending, error = self.states[-1]
+        if error is not None:
+            return None, error
+        try:
+            if pending:
+                values, ops = self.push_token(values, ops, pending)
+            elif expect_operand:
+                return None, None
+            while ops:
+                if ops[0] != "(":
+                    values = self.apply(values, ops[0])
+                ops = ops[1]
+        except Exception as e:
+            return None, e
+        return values[0], None
+
+
+# Ints this many bits long or longer are converted through Decimal: str()
+# refuses ints past sys.get_int_max_str_digits() (4300 by default), while
+# the exact backend computes powers of up to MAX_EXACT_POWER_BITS
+BIG_INT_BITS = 10_000
+
+
+def exact_text(result) -> str:
+    # Full text of an int, a fraction as p/q, or a Decimal, at any size
+    if result.__class__ is int:
+        if -(1 << BIG_INT_BITS) < result < 1 << BIG_INT_BITS:
+            return str(result)
+        from decimal import Decimal
+
+        return str(Decimal(result))
+    if hasattr(result, "denominator"):
+        text = exact_text(result.numerator)
+        if result.denominator == 1:
+            return text
+        return f"{text}/{exact_text(result.denominator)}"
+    return str(result)
+
+
+# Format a result the way it is displayed and stored in history
+def format_result(result) -> str:
+    if result.__class__ is not float:
+        if is_array(result):
+            import vectors
+
+            return vectors.format_array(result)
+        # Exact backend: integers in full, fractions as p/q
+        if hasattr(result, "denominator"):
+            return exact_text(result)
+        # Decimal backend: a whole number only when no digits were rounded
+        # away (rounding leaves a positive exponent, as in 1.2346E+8);
+        # anything else in Decimal's own notation
+        if result.as_tuple().exponent <= 0 and result == result.to_integral_value():
+            return str(result.to_integral_value())
+        return str(result)
+    if result.is_integer():
+        result = int(result)
+    if abs(result) > MAX_NUMBER:
+        raise OverflowError("Number is too big")
+    if abs(result) > 1_000_000_000:
+        result = "{:.6e}".format(result)
+    return str(result)
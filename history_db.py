@@ -0,0 +1,188 @@
+import logging
+import sqlite3
+import threading
+
+
+# Entries written per transaction, and the longest (s) an entry stays
+# unwritten
+BATCH_SIZE = 256
+FLUSH_INTERVAL = 0.5
+
+logger = logging.getLogger("calculator.history")
+
+SCHEMA = (
+    "CREATE TABLE IF NOT EXISTS history ("
+    " id INTEGER PRIMARY KEY,"
+    " expr TEXT NOT NULL,"
+    " result REAL,"
+    " display TEXT NOT NULL)",
+    # Prefix search on expressions and range queries on results
+    "CREATE INDEX IF NOT EXISTS history_expr ON history (expr)",
+    "CREATE INDEX IF NOT EXISTS history_result ON history (result)",
+)
+
+# Upper bound for prefix ranges: sorts after any character
+MAX_CHAR = "\U0010ffff"
+
+
+def parse_query(query):
+    # Returns (sql condition, parameters, predicate for unwritten entries).
+    # "=A..B" finds results from A to B (either end may be left out) and
+    # "=A" finds results equal to A; anything else is an expression prefix.
+    query = query.strip()
+    if not query:
+        return "1", (), lambda entry: True
+
+    if query[0] == "=":
+        low, dots, high = query[1:].partition("..")
+        try:
+            low = float(low) if low.strip() else float("-inf")
+            high = float(high) if high.strip() else float("inf")
+            if not dots:
+                high = low
+        except ValueError:
+            return "0", (), lambda entry: False
+        return (
+            "result BETWEEN ? AND ?",
+            (low, high),
+            lambda entry: entry[1] is not None and low <= entry[1] <= high,
+        )
+
+    return (
+        "expr >= ? AND expr < ?",
+        (query, query + MAX_CHAR),
+        lambda entry: entry[0].startswith(query),
+    )
+
+
+def stored_result(value):
+    # Results are indexed as floats; values too large for one are not
+    try:
+        return float(value)
+    except (OverflowError, TypeError, ValueError):
+        return None
+
+
+class HistoryStore:
+    # History kept in a SQLite file. add() only queues the entry; a writer
+    # thread stores queued entries in batches. Reads see queued entries too,
+    # so nothing waits for the disk.
+    def __init__(self, path, batch_size=BATCH_SIZE, flush_interval=FLUSH_INTERVAL):
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+
+        # One connection shared by both threads; 'lock' serializes its use
+        self.db = sqlite3.connect(path, check_same_thread=False)
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        for statement in SCHEMA:
+            self.db.execute(statement)
+        self.db.commit()
+        self.lock = threading.Lock()
+
+        # Entries not written yet, oldest first, as (expr, result, display).
+        # SQLite numbers them when they are written, so several windows can
+        # share one file.
+        self.pending = []
+        self.pending_lock = threading.Lock()
+        self.stored = None
+
+        self.wakeup = threading.Event()
+        self.closing = False
+        self.writer = threading.Thread(target=self.write_loop, daemon=True)
+        self.writer.start()
+
+    def add(self, expr, result, display):
+        with self.pending_lock:
+            self.pending.append((expr, stored_result(result), display))
+            full = len(self.pending) >= self.batch_size
+        if full:
+            self.wakeup.set()
+
+    def write_loop(self):
+        while not self.closing:
+            self.wakeup.wait(self.flush_interval)
+            self.wakeup.clear()
+            try:
+                self.flush()
+            except sqlite3.Error:
+                # Keep the entries queued and try again on the next pass
+                logger.exception("could not write history")
+
+    def flush(self):
+        with self.lock:
+            with self.pending_lock:
+                batch = self.pending[:]
+            if not batch:
+                return
+            try:
+                self.db.executemany(
+                    "INSERT INTO history (expr, result, display) VALUES (?, ?, ?)",
+                    batch,
+                )
+                self.db.commit()
+            except sqlite3.Error:
+                self.db.rollback()
+                raise
+            # Readers hold 'lock', so they never see a batch both queued
+            # and stored
+            with self.pending_lock:
+                del self.pending[: len(batch)]
+            if self.stored is not None:
+                self.stored += len(batch)
+
+    def queued(self, predicate):
+        with self.pending_lock:
+            return [entry for entry in reversed(self.pending) if predicate(entry)]
+
+    def count(self, query=""):
+        condition, params, predicate = parse_query(query)
+        with self.lock:
+            queued = len(self.queued(predicate))
+            if condition == "1":
+                # The unfiltered count is kept up to date after the first query
+                if self.stored is None:
+                    self.stored = self.db.execute(
+                        "SELECT count(*) FROM history"
+                    ).fetchone()[0]
+                return self.stored + queued
+            sql = f"SELECT count(*) FROM history WHERE {condition}"
+            return self.db.execute(sql, params).fetchone()[0] + queued
+
+    def page(self, offset, limit, query=""):
+        # Newest first: (expr, display) for entries offset..offset+limit-1
+        condition, params, predicate = parse_query(query)
+        with self.lock:
+            queued = self.queued(predicate)
+            rows = [(entry[0], entry[2]) for entry in queued[offset : offset + limit]]
+            if len(rows) < limit:
+                sql = (
+                    f"SELECT expr, display FROM history WHERE {condition} "
+                    "ORDER BY id DESC LIMIT ? OFFSET ?"
+                )
+                skip = max(0, offset - len(queued))
+                rows += self.db.execute(sql, (*params, limit - len(rows), skip))
+            return rows
+
+    def last(self):
+        # Most recent (expr, result), or None when the history is empty
+        with self.lock:
+            with self.pending_lock:
+                if self.pending:
+                    return self.pending[-1][0], self.pending[-1][1]
+            return self.db.execute(
+                "SELECT expr, result FROM history ORDER BY id DESC LIMIT 1"
+            ).fetchone()
+
+    def close(self):
+        # Write whatever is still queued, then stop the writer
+        self.closing = True
+        self.wakeup.set()
+        self.writer.join()
+        try:
+            self.flush()
+        except sqlite3.Error:
+            # Closing the window must not fail because of the history file
+            logger.exception("could not write history")
+        finally:
+            self.db.close()
@@ -0,0 +1,156 @@
+import math
+import operator
+from decimal import Context, Decimal, DivisionByZero, InvalidOperation, Overflow
+from fractions import Fraction
+
+
+# Largest power the exact backend computes, in bits of the result
+MAX_EXACT_POWER_BITS = 1_000_000
+
+# Largest root taken exactly for a fractional exponent such as 8^(1/3)
+MAX_EXACT_ROOT = 64
+
+
+class InexactResult(ArithmeticError):
+    pass
+
+
+def iroot(n, k):
+    # Largest integer r with r**k <= n, by Newton's method on integers
+    if n < 2:
+        return n
+    r = 1 << -(-n.bit_length() // k)
+    while True:
+        s = ((k - 1) * r + n // r ** (k - 1)) // k
+        if s >= r:
+            return r
+        r = s
+
+
+class ExactBackend:
+    # Integers and fractions; integral results are kept as plain ints
+    name = "exact"
+
+    def __init__(self):
+        self.operations = {
+            "+": operator.add,
+            "-": operator.sub,
+            "*": operator.mul,
+            "/": self.div,
+            "^": self.pows,
+        }
+        self.negate = operator.neg
+
+    def normalize(self, value):
+        return value.numerator if value.denominator == 1 else value
+
+    def number(self, text):
+        if text.isdigit():
+            return int(text)
+        return self.normalize(Fraction(text))
+
+    def coerce(self, value):
+        if value.__class__ is int or value.__class__ is Fraction:
+            return value
+        if value.__class__ is float:
+            if not math.isfinite(value):
+                raise InexactResult("value is not finite")
+            # Shortest decimal form, so 0.1 stays 1/10
+            return self.number(repr(value))
+        return self.normalize(Fraction(value))
+
+    def div(self, a, b):
+        if not b:
+            raise ZeroDivisionError("division by zero")
+        return self.normalize(Fraction(a, b))
+
+    def pows(self, a, b):
+        if b.__class__ is Fraction:
+            a = self.root(a, b.denominator)
+            b = b.numerator
+
+        # Check the result size before doing the work
+        if a.__class__ is Fraction:
+            bits = max(a.numerator.bit_length(), a.denominator.bit_length())
+        else:
+            bits = a.bit_length()
+        if abs(b) * bits > MAX_EXACT_POWER_BITS:
+            raise InexactResult("power is too large to compute exactly")
+
+        if b < 0:
+            if not a:
+                raise ZeroDivisionError("division by zero")
+            return self.normalize(Fraction(1, a ** -b))
+        # int ** int uses binary exponentiation on big integers
+        return a**b
+
+    def root(self, a, k):
+        # Exact k-th root of a non-negative rational, if there is one
+        if a < 0 or k > MAX_EXACT_ROOT:
+            raise InexactResult("root has no exact value")
+        a = Fraction(a)
+        numerator = iroot(a.numerator, k)
+        denominator = iroot(a.denominator, k)
+        if numerator**k != a.numerator or denominator**k != a.denominator:
+            raise InexactResult("root has no exact value")
+        return self.normalize(Fraction(numerator, denominator))
+
+
+def decimal_errors(operation):
+    # Decimal's trapped signals raised as the errors the float backend uses
+    def checked(a, b):
+        try:
+            return operation(a, b)
+        except Overflow:
+            raise OverflowError("Number is too big") from None
+        except InvalidOperation:
+            raise ValueError("math domain error") from None
+
+    return checked
+
+
+class DecimalBackend:
+    # Decimal arithmetic rounded to a fixed number of significant digits
+    name = "decimal"
+
+    def __init__(self, precision=28):
+        self.context = Context(
+            prec=precision, traps=[InvalidOperation, DivisionByZero, Overflow]
+        )
+        self.operations = {
+            "+": decimal_errors(self.context.add),
+            "-": decimal_errors(self.context.subtract),
+            "*": decimal_errors(self.context.multiply),
+            "/": self.div,
+            "^": decimal_errors(self.context.power),
+        }
+        # copy_negate is exact, unlike unary minus under the global context
+        self.negate = Decimal.copy_negate
+        self.divide = decimal_errors(self.context.divide)
+
+    def number(self, text):
+        return Decimal(text)
+
+    def coerce(self, value):
+        if value.__class__ is Decimal:
+            return value
+        if value.__class__ is Fraction:
+            return self.context.divide(
+                Decimal(value.numerator), Decimal(value.denominator)
+            )
+        if value.__class__ is float:
+            return Decimal(repr(value))
+        return Decimal(value)
+
+    def div(self, a, b):
+        if not b:
+            raise ZeroDivisionError("division by zero")
+        return self.divide(a, b)
+
+
+def make_backend(name, precision=28):
+    if name in ("exact", "auto"):
+        return ExactBackend()
+    if name == "decimal":
+        return DecimalBackend(precision)
+    raise ValueError(f"unknown numeric backend '{name}'")
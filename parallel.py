@@ -0,0 +1,84 @@
+import os
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from itertools import islice
+from multiprocessing.util import Finalize
+
+from engine import Calculate
+
+
+CHUNK_SIZE = 4096
+
+# Engine owned by each worker process, created once by the pool initializer
+worker_engine = None
+
+
+def init_worker(options=None):
+    global worker_engine
+    worker_engine = Calculate(**(options or {}))
+    if worker_engine.program_cache is not None:
+        # Pool workers leave through os._exit, which skips atexit; this runs
+        # when the pool shuts them down
+        Finalize(worker_engine, worker_engine.program_cache.save, exitpriority=10)
+
+
+def evaluate_chunk(exprs):
+    return worker_engine.calc_many(exprs)
+
+
+def chunked(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def map_chunks(jobs, workers=None, options=None):
+    # Evaluate (tag, exprs) jobs and yield (tag, outcomes) in submission order;
+    # options are passed to each worker's Calculate
+    workers = workers or os.cpu_count() or 1
+    if workers == 1:
+        init_worker(options)
+        for tag, exprs in jobs:
+            yield tag, evaluate_chunk(exprs)
+        return
+
+    # Keep a few chunks per worker in flight so memory stays bounded
+    max_pending = workers * 2
+    pending = deque()
+    with ProcessPoolExecutor(
+        workers, initializer=init_worker, initargs=(options,)
+    ) as pool:
+        for tag, exprs in jobs:
+            pending.append((tag, pool.submit(evaluate_chunk, exprs)))
+            if len(pending) >= max_pending:
+                tag, future = pending.popleft()
+                yield tag, future.result()
+        while pending:
+            tag, future = pending.popleft()
+            yield tag, future.result()
+
+
+def calc_many_parallel(
+    exprs, workers=None, chunk_size=CHUNK_SIZE, options=None
+) -> list:
+    # Same result shape and order as Calculate.calc_many
+    jobs = ((None, chunk) for chunk in chunked(exprs, chunk_size))
+    results = []
+    for _, outcomes in map_chunks(jobs, workers, options):
+        results.extend(outcomes)
+    return results
+
+
+def evaluate_stream_parallel(
+    rows, workers=None, chunk_size=CHUNK_SIZE, options=None
+):
+    # Parallel counterpart of stream.evaluate_stream, preserving input order
+    jobs = (
+        (chunk, [expr for _, expr in chunk]) for chunk in chunked(rows, chunk_size)
+    )
+    for chunk, outcomes in map_chunks(jobs, workers, options):
+        for (line_no, expr), (result, error) in zip(chunk, outcomes):
+            yield line_no, expr, result, error
@@ -0,0 +1,138 @@
+import logging
+import sys
+import time
+import tracemalloc
+from collections import deque
+
+
+# Latency samples kept per stage for percentiles
+SAMPLE_SIZE = 2048
+
+# Operator symbols grouped into the stage they are timed under
+OPERATOR_STAGES = {
+    "^": "power",
+    "*": "mul_div",
+    "/": "mul_div",
+    "@": "mul_div",
+    "+": "add_sub",
+    "-": "add_sub",
+}
+
+logger = logging.getLogger("calculator.profile")
+
+
+def percentile(samples, fraction):
+    if not samples:
+        return 0.0
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+class StageStats:
+    def __init__(self):
+        self.calls = 0
+        self.total = 0.0
+        self.samples = deque(maxlen=SAMPLE_SIZE)
+        # Net allocated blocks, or bytes when tracing memory
+        self.allocated = 0
+        self.peak = 0
+
+    def snapshot(self):
+        return {
+            "calls": self.calls,
+            "total": self.total,
+            "mean": self.total / self.calls if self.calls else 0.0,
+            "p50": percentile(self.samples, 0.50),
+            "p90": percentile(self.samples, 0.90),
+            "p99": percentile(self.samples, 0.99),
+            "allocated": self.allocated,
+            "peak": self.peak,
+        }
+
+
+class StageProfiler:
+    # Timings are inclusive: 'calc' contains 'parse', which contains
+    # 'tokenize', and 'evaluate' contains the operator stages
+    def __init__(self, trace_memory=False, log_interval=None):
+        self.stages = {}
+        self.trace_memory = trace_memory
+        self.log_interval = log_interval
+        self.next_log = time.perf_counter() + log_interval if log_interval else None
+        # Only stop tracemalloc on close if this profiler started it
+        self.started_tracing = trace_memory and not tracemalloc.is_tracing()
+        if self.started_tracing:
+            tracemalloc.start()
+        # Highest traced memory wiped by reset_peak() since the innermost
+        # running stage started; stages nest, and each one resets the peak
+        self.lost_peak = 0
+
+    def wrap(self, stage, func):
+        stats = self.stages.setdefault(stage, StageStats())
+        clock = time.perf_counter
+
+        if self.trace_memory:
+            # Bytes allocated and peak usage during the stage. Resetting
+            # the peak would hide it from the enclosing stage, so the peak
+            # reached so far is kept and handed back when this stage ends.
+            def measured(*args):
+                before, outer_peak = tracemalloc.get_traced_memory()
+                outer_peak = max(outer_peak, self.lost_peak)
+                tracemalloc.reset_peak()
+                self.lost_peak = 0
+                start = clock()
+                try:
+                    return func(*args)
+                finally:
+                    elapsed = clock() - start
+                    after, peak = tracemalloc.get_traced_memory()
+                    peak = max(peak, self.lost_peak)
+                    self.lost_peak = max(outer_peak, peak)
+                    stats.allocated += after - before
+                    stats.peak = max(stats.peak, peak - before)
+                    self.record(stats, elapsed)
+
+        else:
+            # Net allocated blocks during the stage
+            blocks = sys.getallocatedblocks
+
+            def measured(*args):
+                before = blocks()
+                start = clock()
+                try:
+                    return func(*args)
+                finally:
+                    elapsed = clock() - start
+                    stats.allocated += blocks() - before
+                    self.record(stats, elapsed)
+
+        return measured
+
+    def record(self, stats, elapsed):
+        stats.calls += 1
+        stats.total += elapsed
+        stats.samples.append(elapsed)
+        if self.next_log is not None and time.perf_counter() >= self.next_log:
+            self.next_log = time.perf_counter() + self.log_interval
+            logger.info(self.log_line())
+
+    def snapshot(self):
+        return {stage: stats.snapshot() for stage, stats in self.stages.items()}
+
+    def log_line(self):
+        parts = []
+        for stage, data in self.snapshot().items():
+            parts.append(
+                f"{stage} n={data['calls']} total={data['total'] * 1e3:.1f}ms "
+                f"p50={data['p50'] * 1e6:.1f}us p99={data['p99'] * 1e6:.1f}us "
+                f"alloc={data['allocated']}"
+            )
+        return "; ".join(parts)
+
+    def reset(self):
+        for stats in self.stages.values():
+            stats.__init__()
+
+    def close(self):
+        if self.started_tracing:
+            tracemalloc.stop()
+            self.started_tracing = False
@@ -0,0 +1,296 @@
+import atexit
+import contextlib
+import hashlib
+import importlib.util
+import mmap
+import os
+import struct
+import tempfile
+import time
+from array import array
+
+from engine import is_array
+
+try:
+    import fcntl
+except ImportError:
+    # No file locking; saves still replace the file atomically
+    fcntl = None
+
+
+# File layout: header, one fixed-size record per entry, then the encoded
+# programs. Records hold the key, where the program is, how its numbers
+# are stored and when the entry was last used (Unix time).
+MAGIC = b"CALCPRG1"
+HEADER = struct.Struct("<8s16sI")
+RECORD = struct.Struct("<16sQIId")
+LENGTH = struct.Struct("<I")
+
+MAX_ENTRIES = 100_000
+MAX_BYTES = 64 * 1024 * 1024
+
+# Entries used this long (s) after their stored time get a new time on
+# save; a run that only reads recently used entries leaves the file alone
+REFRESH_AGE = 3600.0
+
+# Program nodes by opcode: 0 is a number, VARIABLE and up are the variables
+NODES = (None, "+", "-", "*", "/", "^", "@", "neg", "ans")
+OPCODES = {node: code for code, node in enumerate(NODES) if node}
+VARIABLE = 16
+
+# How an entry's numbers are stored
+FLOAT64 = 0
+TEXT = 1
+
+
+def engine_version():
+    # Digest of the modules that decide what a parse produces, so a changed
+    # parser never reads programs written by an older one
+    digest = hashlib.blake2b(digest_size=16)
+    for module in ("engine", "numeric"):
+        with open(importlib.util.find_spec(module).origin, "rb") as f:
+            digest.update(f.read())
+    return digest.digest()
+
+
+def encode(program, variables, kind):
+    # Opcodes, one byte per node, followed by the numbers. Raises for
+    # programs that cannot be stored, such as ones holding a vector.
+    opcodes = bytearray()
+    numbers = []
+    for node in program:
+        if node.__class__ is str:
+            code = OPCODES.get(node)
+            opcodes.append(VARIABLE + variables.index(node) if code is None else code)
+        else:
+            # Checked here rather than left to array('d'), which some NumPy
+            # versions let turn a one-element vector into a plain number
+            if is_array(node):
+                raise TypeError("vectors are not cached")
+            opcodes.append(0)
+            numbers.append(node)
+    if kind == FLOAT64:
+        tail = array("d", numbers).tobytes()
+    else:
+        tail = "\0".join(map(str, numbers)).encode()
+    return LENGTH.pack(len(opcodes)) + opcodes + tail
+
+
+class ProgramCache:
+    # Parsed programs kept in a file between runs, keyed by a hash of the
+    # expression, its variables, the backend and the engine version. The
+    # file is memory-mapped read-only; programs parsed during the run are
+    # merged into it by save(), which replaces the file atomically, so other
+    # processes reading the old file are never disturbed.
+    def __init__(
+        self, path, calc_engine, max_entries=MAX_ENTRIES, max_bytes=MAX_BYTES
+    ):
+        self.path = path
+        self.calc_engine = calc_engine
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.kind = FLOAT64 if calc_engine.number is float else TEXT
+        self.version = engine_version()
+        self.salt = hashlib.blake2b(
+            self.version + calc_engine.backend.encode(), digest_size=16
+        ).digest()
+
+        # Entries parsed this run: key -> (encoded program, kind)
+        self.added = {}
+        # Entries read from the file this run: key -> stored last-used time
+        self.used = {}
+        self.hits = 0
+        self.misses = 0
+        # (mapped file, index) as one value, so a thread reading an entry
+        # never pairs the index of one file with the bytes of another
+        self.stored = (None, {})
+        self.load()
+        atexit.register(self.save)
+
+    def load(self):
+        # Map the file and read its records; a missing, empty, damaged or
+        # outdated file is treated as empty and rewritten on save. The old
+        # map is left for the garbage collector, as other threads may still
+        # be reading from it.
+        self.stored = (None, {})
+        try:
+            with open(self.path, "rb") as f:
+                mapped = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except (OSError, ValueError):
+            return
+        try:
+            magic, version, count = HEADER.unpack_from(mapped)
+            records = mapped[HEADER.size : HEADER.size + count * RECORD.size]
+            if magic != MAGIC or version != self.version:
+                raise ValueError("cache file is from another engine version")
+            index = {
+                key: (offset, length, kind, last_used)
+                for key, offset, length, kind, last_used in RECORD.iter_unpack(
+                    records
+                )
+            }
+        except (struct.error, ValueError):
+            mapped.close()
+            return
+        self.stored = (mapped, index)
+
+    def key(self, expr, variables):
+        text = "\0".join((expr, *variables)) if variables else expr
+        return hashlib.blake2b(text.encode(), digest_size=16, key=self.salt).digest()
+
+    def decode(self, blob, kind, variables):
+        count = LENGTH.unpack_from(blob)[0]
+        opcodes = blob[LENGTH.size : LENGTH.size + count]
+        tail = blob[LENGTH.size + count :]
+        if kind == FLOAT64:
+            numbers = iter(array("d", tail))
+        else:
+            text = bytes(tail).decode()
+            numbers = map(self.calc_engine.number, text.split("\0") if text else ())
+        names = NODES + (None,) * (VARIABLE - len(NODES)) + tuple(variables)
+        program = [next(numbers) if code == 0 else names[code] for code in opcodes]
+        if len(program) != count or next(numbers, None) is not None:
+            raise ValueError("damaged cache entry")
+        return program
+
+    def lookup(self, key, variables):
+        mapped, index = self.stored
+        found = index.get(key)
+        if found is not None:
+            offset, length, kind, last_used = found
+            self.used[key] = last_used
+            return self.decode(mapped[offset : offset + length], kind, variables)
+        found = self.added.get(key)
+        if found is not None:
+            return self.decode(found[0], found[1], variables)
+        return None
+
+    def parse(self, expr, variables=()):
+        # Same result as Calculate.parse, read from the cache when possible
+        calc_engine = self.calc_engine
+        budget = calc_engine.budget
+        if budget is not None and (
+            budget.max_tokens is not None
+            or budget.max_depth is not None
+            or budget.max_operations is not None
+        ):
+            # Token limits are checked while parsing, so parse every time
+            tokens = calc_engine.parse_expr(expr, variables)
+            return calc_engine.parse_tokens(tokens, variables)
+
+        key = self.key(expr, variables)
+        try:
+            program = self.lookup(key, variables)
+        except Exception:
+            program = None
+        if program is not None:
+            self.hits += 1
+            return program
+
+        self.misses += 1
+        program = calc_engine.parse_tokens(
+            calc_engine.parse_expr(expr, variables), variables
+        )
+        if len(self.added) < self.max_entries:
+            try:
+                self.added[key] = (encode(program, variables, self.kind), self.kind)
+            except (TypeError, ValueError):
+                pass
+        return program
+
+    @contextlib.contextmanager
+    def locked(self):
+        # Serializes savers; readers never take the lock
+        with open(self.path + ".lock", "a") as lock:
+            if fcntl is not None:
+                fcntl.flock(lock, fcntl.LOCK_EX)
+            yield
+
+    def read_entries(self):
+        # key -> [encoded program, kind, last used] from the file as it is
+        # now, which another process may have replaced since load()
+        entries = {}
+        try:
+            with open(self.path, "rb") as f:
+                data = f.read()
+            magic, version, count = HEADER.unpack_from(data)
+            if magic != MAGIC or version != self.version:
+                return entries
+            records = data[HEADER.size : HEADER.size + count * RECORD.size]
+            for key, offset, length, kind, last_used in RECORD.iter_unpack(records):
+                entries[key] = [data[offset : offset + length], kind, last_used]
+        except (OSError, struct.error):
+            pass
+        return entries
+
+    def save(self):
+        # Merge this run's entries into the file, evicting the least
+        # recently used ones past the size limits; returns whether the file
+        # was written
+        now = time.time()
+        # Copies, as other threads may keep parsing while this runs
+        used = list(self.used.items())
+        added = list(self.added.items())
+        refresh = [key for key, last_used in used if now - last_used > REFRESH_AGE]
+        if not added and not refresh:
+            return False
+
+        with self.locked():
+            entries = self.read_entries()
+            for key in refresh:
+                if key in entries:
+                    entries[key][2] = now
+            for key, (blob, kind) in added:
+                entries[key] = [blob, kind, now]
+
+            kept = sorted(entries.items(), key=lambda item: item[1][2], reverse=True)
+            kept = kept[: self.max_entries]
+            size = HEADER.size
+            for count, (_, (blob, _, _)) in enumerate(kept):
+                size += RECORD.size + len(blob)
+                if size > self.max_bytes:
+                    kept = kept[:count]
+                    break
+            self.write(kept)
+
+        for key, _ in added:
+            self.added.pop(key, None)
+        for key, _ in used:
+            self.used.pop(key, None)
+        self.load()
+        return True
+
+    def write(self, entries):
+        offset = HEADER.size + len(entries) * RECORD.size
+        records = []
+        for key, (blob, kind, last_used) in entries:
+            records.append(RECORD.pack(key, offset, len(blob), kind, last_used))
+            offset += len(blob)
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        fd, temp = tempfile.mkstemp(dir=directory, prefix=".program-cache-")
+        try:
+            with os.fdopen(fd, "wb") as f:
+                f.write(HEADER.pack(MAGIC, self.version, len(entries)))
+                f.writelines(records)
+                f.writelines(blob for _, (blob, _, _) in entries)
+            os.replace(temp, self.path)
+        except BaseException:
+            os.unlink(temp)
+            raise
+
+    def stats(self):
+        return {
+            "stored": len(self.stored[1]),
+            "added": len(self.added),
+            "hits": self.hits,
+            "misses": self.misses,
+        }
+
+    def close(self):
+        self.save()
+        atexit.unregister(self.save)
+        mapped, _ = self.stored
+        self.stored = (None, {})
+        if mapped is not None:
+            mapped.close()
@@ -0,0 +1,154 @@
+import mmap
+import re
+from array import array
+
+
+# Token kinds are the regex group numbers below. Operators, parentheses,
+# vector brackets and commas, and 'ans' map to the strings the parser expects.
+TOKEN_TEXT = (None, "+", "-", "*", "/", "^", "@", "(", ")", "[", "]", ",", "ans")
+UNKNOWN_NAME = 13
+NUMBER = 14
+NEWLINE = 15
+OTHER = 16
+
+# Same tokens as engine.TOKEN_PATTERN, over bytes, with line breaks kept;
+# other whitespace never matches, so finditer skips it
+SCAN_PATTERN = re.compile(
+    rb"(\+)|(-)|(\*)|(/)|(\^)|(@)|(\()|(\))|(\[)|(\])|(,)"
+    rb"|(ans(?!\w))|([A-Za-z_]\w*)"
+    rb"|(\d+\.?\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?)|(\n)|(\S)"
+)
+
+# Tokens scanned per buffer fill; a longer line grows the buffer
+TOKEN_CAPACITY = 64 * 1024
+
+
+class TokenBuffer:
+    # Preallocated arrays for one chunk of whole lines: the kind, byte span
+    # and float value of each token, and the token count at each line end
+    def __init__(self, capacity=TOKEN_CAPACITY):
+        # A fill stops at the first line break after 'limit' tokens
+        self.limit = capacity
+        self.capacity = capacity
+        self.kinds = array("B", bytes(capacity))
+        self.starts = array("q", bytes(8 * capacity))
+        self.ends = array("q", bytes(8 * capacity))
+        self.values = array("d", bytes(8 * capacity))
+        self.breaks = array("q")
+        self.count = 0
+
+    def grow(self):
+        extra = self.capacity
+        self.kinds.extend(bytes(extra))
+        self.starts.extend(array("q", bytes(8 * extra)))
+        self.ends.extend(array("q", bytes(8 * extra)))
+        self.values.extend(array("d", bytes(8 * extra)))
+        self.capacity += extra
+
+    def scan(self, data, pos=0, parse_values=True):
+        # Fill the buffer with whole lines from data[pos:], stopping at the
+        # first line break once it is full; returns where scanning stopped.
+        # Float values are only parsed when parse_values is set.
+        kinds = self.kinds
+        starts = self.starts
+        ends = self.ends
+        values = self.values
+        breaks = self.breaks
+        del breaks[:]
+        count = 0
+        capacity = self.capacity
+        limit = self.limit
+
+        for match in SCAN_PATTERN.finditer(data, pos):
+            kind = match.lastindex
+            if kind == NEWLINE:
+                breaks.append(count)
+                if count >= limit:
+                    self.count = count
+                    return match.end()
+                continue
+            if count == capacity:
+                self.grow()
+                capacity = self.capacity
+            kinds[count] = kind
+            starts[count], ends[count] = match.span()
+            if kind == NUMBER and parse_values:
+                values[count] = float(match.group())
+            count += 1
+
+        # The last line may have no line break
+        if not breaks or breaks[-1] != count:
+            breaks.append(count)
+        self.count = count
+        return len(data)
+
+    def text(self, data, first, stop):
+        # Source text of tokens first..stop-1, decoded only when asked for
+        return str(data[self.starts[first] : self.ends[stop - 1]], "utf-8")
+
+    def tokens(self, data, first, stop, number=None):
+        # Parser tokens for one line. Float numbers come from the values
+        # array; other backends read the digits with their own number().
+        kinds = self.kinds
+        starts = self.starts
+        ends = self.ends
+        tokens = []
+        for i in range(first, stop):
+            kind = kinds[i]
+            if kind == NUMBER:
+                if number is None:
+                    tokens.append(self.values[i])
+                else:
+                    tokens.append(number(str(data[starts[i] : ends[i]], "ascii")))
+            elif kind < UNKNOWN_NAME:
+                tokens.append(TOKEN_TEXT[kind])
+            elif kind == UNKNOWN_NAME:
+                name = str(data[starts[i] : ends[i]], "ascii")
+                raise ValueError(f"unknown name '{name}'")
+            else:
+                # Decode to the end of the line so a multi-byte character
+                # is reported whole
+                rest = str(data[starts[i] : ends[stop - 1]], "utf-8", "replace")
+                raise ValueError(f"unexpected character '{rest[0]}'")
+        return tokens
+
+
+def evaluate_mapped(calc_engine, data, want_text=False, capacity=TOKEN_CAPACITY):
+    # Yield (line number, expression, result, error) for each non-blank line
+    # of a bytes-like object, such as a memoryview of an mmap. The expression
+    # text is only decoded when want_text is set; otherwise it is None.
+    buffer = TokenBuffer(capacity)
+    number = None if calc_engine.number is float else calc_engine.number
+    parse_tokens = calc_engine.parse_tokens
+    evaluate = calc_engine.evaluate
+    line_no = 0
+    pos = 0
+    size = len(data)
+
+    while pos < size:
+        pos = buffer.scan(data, pos, number is None)
+        first = 0
+        for stop in buffer.breaks:
+            line_no += 1
+            if stop == first:
+                continue
+            try:
+                tokens = buffer.tokens(data, first, stop, number)
+                result = evaluate(parse_tokens(tokens))
+                error = None
+            except Exception as e:
+                result = None
+                error = e
+            text = buffer.text(data, first, stop) if want_text else None
+            yield line_no, text, result, error
+            first = stop
+
+
+def map_file(path):
+    # Read-only mapping of a whole file, or None for an empty file, which
+    # cannot be mapped
+    with open(path, "rb") as f:
+        try:
+            return mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:
+            return None
@@ -0,0 +1,363 @@
+import argparse
+import asyncio
+import json
+import os
+import random
+import sys
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from engine import BACKENDS, Budget, Calculate
+from profiling import percentile
+from stream import result_text
+
+
+HOST = "127.0.0.1"
+PORT = 8765
+
+# Expressions handed to the engine per calc_many call. Requests that arrive
+# while the engine is busy are queued and go into the next batch together.
+BATCH_SIZE = 256
+
+# Expressions queued for the engine; when full, connections stop being read
+MAX_QUEUED = 4096
+
+# Requests per connection waiting for their reply
+MAX_IN_FLIGHT = 64
+
+# Seconds a request may wait for its results, unless it asks for less
+TIMEOUT = 5.0
+
+# Longest request line accepted, in bytes
+MAX_LINE = 1 << 20
+
+
+def request_id(line):
+    # The id of a request line, or None if it cannot be read
+    try:
+        return json.loads(line).get("id")
+    except (ValueError, AttributeError):
+        return None
+
+
+class EvaluationService:
+    # Line-delimited JSON over TCP or a Unix socket. Requests are
+    # {"id": ..., "expr": "1+2"} or {"id": ..., "exprs": [...]}, with an
+    # optional "timeout" in seconds; replies carry the same id and either
+    # "result" / "error" or a "results" list of those.
+    def __init__(
+        self,
+        options=None,
+        batch_size=BATCH_SIZE,
+        batch_window=0.0,
+        max_queued=MAX_QUEUED,
+        max_in_flight=MAX_IN_FLIGHT,
+        timeout=TIMEOUT,
+    ):
+        options = dict(options or {})
+        # The engine also stops any single expression at the timeout
+        if options.get("budget") is None:
+            options["budget"] = Budget(timeout=timeout)
+        self.calc_engine = Calculate(**options)
+        self.batch_size = batch_size
+        self.batch_window = batch_window
+        self.max_queued = max_queued
+        self.max_in_flight = max_in_flight
+        self.timeout = timeout
+        # One thread runs every batch: batching already keeps the engine
+        # busy, and more threads would only contend for the GIL
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.queue = None
+        self.batches = 0
+        self.evaluated = 0
+
+    async def start(self, host=HOST, port=PORT, unix=None):
+        self.queue = asyncio.Queue(self.max_queued)
+        self.batcher = asyncio.create_task(self.run_batches())
+        if unix:
+            return await asyncio.start_unix_server(self.handle, unix, limit=MAX_LINE)
+        return await asyncio.start_server(self.handle, host, port, limit=MAX_LINE)
+
+    async def run_batches(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self.queue.get()]
+            if self.batch_window:
+                await asyncio.sleep(self.batch_window)
+            while len(batch) < self.batch_size and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+
+            # Requests that already timed out are not evaluated
+            batch = [(expr, future) for expr, future in batch if not future.done()]
+            if not batch:
+                continue
+            exprs = [expr for expr, _ in batch]
+            outcomes = await loop.run_in_executor(
+                self.executor, self.calc_engine.calc_many, exprs
+            )
+            self.batches += 1
+            self.evaluated += len(batch)
+            for (_, future), outcome in zip(batch, outcomes):
+                if not future.done():
+                    future.set_result(outcome)
+
+    async def evaluate(self, exprs, timeout):
+        # (result, error) per expression; waiting for queue space is what
+        # slows a client down when the engine falls behind
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        futures = []
+        try:
+            for expr in exprs:
+                future = loop.create_future()
+                await asyncio.wait_for(
+                    self.queue.put((expr, future)), deadline - loop.time()
+                )
+                futures.append(future)
+            if futures:
+                await asyncio.wait(futures, timeout=deadline - loop.time())
+        except asyncio.TimeoutError:
+            pass
+
+        outcomes = []
+        error = TimeoutError(f"timed out after {timeout}s")
+        for i in range(len(exprs)):
+            if i < len(futures) and futures[i].done():
+                outcomes.append(futures[i].result())
+            else:
+                if i < len(futures):
+                    futures[i].cancel()
+                outcomes.append((None, error))
+        return outcomes
+
+    async def handle(self, reader, writer):
+        in_flight = asyncio.Semaphore(self.max_in_flight)
+        tasks = set()
+        try:
+            while True:
+                line = await reader.readline()
+                if not line:
+                    break
+                # Stop reading once too many replies are outstanding
+                await in_flight.acquire()
+                task = asyncio.create_task(self.respond(line, writer, in_flight))
+                tasks.add(task)
+                task.add_done_callback(tasks.discard)
+            if tasks:
+                await asyncio.gather(*tasks)
+        except (ConnectionError, ValueError):
+            # Peer went away, or sent a line longer than MAX_LINE
+            pass
+        finally:
+            for task in tasks:
+                task.cancel()
+            writer.close()
+
+    async def respond(self, line, writer, in_flight):
+        try:
+            try:
+                reply = json.dumps(await self.reply(line))
+            except Exception as e:
+                # Answer anyway, so the client is never left waiting
+                reply = json.dumps({"id": request_id(line), "error": str(e)})
+            writer.write(reply.encode() + b"\n")
+            await writer.drain()
+        except ConnectionError:
+            pass
+        finally:
+            in_flight.release()
+
+    async def reply(self, line):
+        try:
+            request = json.loads(line)
+            request_id = request.get("id")
+            timeout = min(float(request.get("timeout", self.timeout)), self.timeout)
+        except (ValueError, AttributeError, TypeError) as e:
+            return {"id": None, "error": f"invalid request: {e}"}
+
+        single = "expr" in request
+        exprs = [request["expr"]] if single else request.get("exprs")
+        if not isinstance(exprs, list) or not all(
+            isinstance(expr, str) for expr in exprs
+        ):
+            error = "invalid request: expected 'expr' or 'exprs'"
+            return {"id": request_id, "error": error}
+
+        outcomes = await self.evaluate(exprs, timeout)
+        results = [
+            {"result": result_text(result)} if error is None else {"error": str(error)}
+            for result, error in outcomes
+        ]
+        if single:
+            return {"id": request_id, **results[0]}
+        return {"id": request_id, "results": results}
+
+    def close(self):
+        self.batcher.cancel()
+        self.executor.shutdown(wait=False)
+
+
+# Load generator
+
+
+def random_expression(rng):
+    ops = "+-*/^"
+    terms = [str(rng.randint(1, 99)) for _ in range(rng.randint(2, 8))]
+    expr = terms[0]
+    for term in terms[1:]:
+        op = rng.choice(ops)
+        expr += op + (str(rng.randint(1, 3)) if op == "^" else term)
+    return expr
+
+
+async def open_connection(host, port, unix):
+    if unix:
+        return await asyncio.open_unix_connection(unix, limit=MAX_LINE)
+    return await asyncio.open_connection(host, port, limit=MAX_LINE)
+
+
+async def run_load(host, port, unix, requests, concurrency, batch, seed=0):
+    # 'concurrency' connections, each sending one request at a time
+    rng = random.Random(seed)
+    pool = [random_expression(rng) for _ in range(1000)]
+    latencies = []
+    errors = 0
+    remaining = requests
+
+    async def worker():
+        nonlocal remaining, errors
+        reader, writer = await open_connection(host, port, unix)
+        try:
+            while remaining > 0:
+                remaining -= 1
+                exprs = [rng.choice(pool) for _ in range(batch)]
+                request = {"id": remaining}
+                if batch == 1:
+                    request["expr"] = exprs[0]
+                else:
+                    request["exprs"] = exprs
+                started = time.perf_counter()
+                writer.write(json.dumps(request).encode() + b"\n")
+                reply = json.loads(await reader.readline())
+                latencies.append(time.perf_counter() - started)
+                outcomes = reply.get("results", [reply])
+                errors += sum("error" in outcome for outcome in outcomes)
+        finally:
+            writer.close()
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - started
+    return {
+        "requests": len(latencies),
+        "expressions": len(latencies) * batch,
+        "errors": errors,
+        "elapsed": elapsed,
+        "requests_per_sec": len(latencies) / elapsed,
+        "p50_ms": percentile(latencies, 0.50) * 1e3,
+        "p99_ms": percentile(latencies, 0.99) * 1e3,
+        "max_ms": max(latencies, default=0.0) * 1e3,
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve the calculation engine on a local socket, "
+        "or put load on a running server."
+    )
+    parser.add_argument("--host", default=HOST)
+    parser.add_argument("--port", type=int, default=PORT)
+    parser.add_argument("--unix", help="Unix socket path instead of TCP")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve = commands.add_parser("serve", help="run the evaluation service")
+    serve.add_argument("--backend", choices=BACKENDS, default="float")
+    serve.add_argument("--batch-size", type=int, default=BATCH_SIZE)
+    serve.add_argument(
+        "--batch-window",
+        type=float,
+        default=0.0,
+        help="seconds to wait for more requests before a batch (default: 0)",
+    )
+    serve.add_argument("--max-queued", type=int, default=MAX_QUEUED)
+    serve.add_argument("--max-in-flight", type=int, default=MAX_IN_FLIGHT)
+    serve.add_argument("--timeout", type=float, default=TIMEOUT)
+
+    load = commands.add_parser("load", help="generate load and report latency")
+    load.add_argument("--requests", type=int, default=10_000)
+    load.add_argument("--concurrency", type=int, default=32)
+    load.add_argument("--batch", type=int, default=1, help="expressions per request")
+    load.add_argument(
+        "--local",
+        action="store_true",
+        help="start a server in this process for the run",
+    )
+    return parser.parse_args(argv)
+
+
+def service_from_args(args):
+    return EvaluationService(
+        {"backend": args.backend},
+        batch_size=args.batch_size,
+        batch_window=args.batch_window,
+        max_queued=args.max_queued,
+        max_in_flight=args.max_in_flight,
+        timeout=args.timeout,
+    )
+
+
+async def serve(args):
+    service = service_from_args(args)
+    server = await service.start(args.host, args.port, args.unix)
+    where = args.unix or f"{args.host}:{args.port}"
+    print(f"serving on {where}", file=sys.stderr)
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        service.close()
+        if args.unix and os.path.exists(args.unix):
+            os.unlink(args.unix)
+
+
+async def load(args):
+    service = server = None
+    if args.local:
+        service = EvaluationService()
+        server = await service.start(args.host, args.port, args.unix)
+    try:
+        report = await run_load(
+            args.host, args.port, args.unix, args.requests, args.concurrency, args.batch
+        )
+    finally:
+        if server is not None:
+            server.close()
+            await server.wait_closed()
+            service.close()
+    print(
+        f"{report['requests']} requests ({report['expressions']} expressions, "
+        f"{report['errors']} errors) in {report['elapsed']:.2f}s: "
+        f"{report['requests_per_sec']:.0f} req/s, p50 {report['p50_ms']:.2f} ms, "
+        f"p99 {report['p99_ms']:.2f} ms, max {report['max_ms']:.2f} ms"
+    )
+    if service is not None and service.batches:
+        print(
+            f"{service.batches} engine batches, "
+            f"{service.evaluated / service.batches:.1f} expressions per batch"
+        )
+    return 0
+
+
+def main(argv=None):
+    args = parse_args(argv)
+    try:
+        if args.command == "serve":
+            asyncio.run(serve(args))
+            return 0
+        return asyncio.run(load(args))
+    except KeyboardInterrupt:
+        return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
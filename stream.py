@@ -0,0 +1,190 @@
+import csv
+import struct
+import sys
+import time
+from itertools import islice
+
+from engine import Calculate, exact_text, is_array
+
+
+# Lines evaluated per calc_many call; bounds memory independent of file size
+CHUNK_SIZE = 1024
+
+FORMATS = ("text", "csv", "bin")
+
+FLOAT64 = struct.Struct("<d")
+
+
+class StreamStats:
+    def __init__(self):
+        self.lines = 0
+        self.errors = 0
+        self.started = time.perf_counter()
+        self.elapsed = 0.0
+
+    def stop(self):
+        self.elapsed = time.perf_counter() - self.started
+
+    def lines_per_sec(self):
+        return self.lines / self.elapsed if self.elapsed else 0.0
+
+    def summary(self):
+        return (
+            f"{self.lines} lines, {self.errors} errors, "
+            f"{self.elapsed:.3f}s, {self.lines_per_sec():.0f} lines/sec"
+        )
+
+
+def result_text(result):
+    # Floats keep their shortest round-trip form; exact values print as-is
+    if result.__class__ is float:
+        return repr(result)
+    if is_array(result):
+        import vectors
+
+        return vectors.array_text(result)
+    return exact_text(result)
+
+
+def result_float(result):
+    if is_array(result):
+        # A vector has no single value to write
+        return float("nan")
+    try:
+        return float(result)
+    except OverflowError:
+        return float("inf") if result > 0 else float("-inf")
+
+
+# Writers receive one row at a time and write it immediately
+class TextWriter:
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, line_no, expr, result, error):
+        if error is None:
+            self.out.write(f"{result_text(result)}\n")
+        else:
+            self.out.write(f"Error: {error}\n")
+
+
+class CsvWriter:
+    def __init__(self, out):
+        self.writer = csv.writer(out)
+        self.writer.writerow(("line", "expression", "result", "error"))
+
+    def write(self, line_no, expr, result, error):
+        if error is None:
+            self.writer.writerow((line_no, expr, result_text(result), ""))
+        else:
+            self.writer.writerow((line_no, expr, "", error))
+
+
+class BinaryWriter:
+    # Raw little-endian float64, one value per input line; errors are NaN
+    def __init__(self, out):
+        self.out = out
+
+    def write(self, line_no, expr, result, error):
+        value = result_float(result) if error is None else float("nan")
+        self.out.write(FLOAT64.pack(value))
+
+
+WRITERS = {"text": TextWriter, "csv": CsvWriter, "bin": BinaryWriter}
+
+
+def read_expressions(lines):
+    # Yield (line number, expression) pairs, skipping blank lines
+    for line_no, line in enumerate(lines, 1):
+        expr = line.strip()
+        if expr:
+            yield line_no, expr
+
+
+def evaluate_stream(calc_engine, rows, chunk_size=CHUNK_SIZE):
+    # Yield (line number, expression, result, error) for each input row
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        outcomes = calc_engine.calc_many([expr for _, expr in chunk])
+        for (line_no, expr), (result, error) in zip(chunk, outcomes):
+            yield line_no, expr, result, error
+
+
+def evaluate_file(
+    lines,
+    out,
+    fmt="text",
+    errors=sys.stderr,
+    calc_engine=None,
+    chunk_size=CHUNK_SIZE,
+    workers=1,
+    options=None,
+):
+    if fmt not in WRITERS:
+        raise ValueError(f"unknown output format '{fmt}'")
+
+    writer = WRITERS[fmt](out)
+    stats = StreamStats()
+    rows = read_expressions(lines)
+    if workers == 1:
+        if calc_engine is None:
+            calc_engine = Calculate(**(options or {}))
+        rows = evaluate_stream(calc_engine, rows, chunk_size)
+    else:
+        # Process pool is only imported when parallel evaluation is requested
+        from parallel import evaluate_stream_parallel
+
+        rows = evaluate_stream_parallel(rows, workers, chunk_size, options)
+
+    return write_rows(rows, writer, stats, errors)
+
+
+def evaluate_mapped_file(
+    path, out, fmt="text", errors=sys.stderr, calc_engine=None, options=None
+):
+    # Single-process evaluation that scans a memory-mapped file in place,
+    # without decoding it into a string per line
+    from scanner import evaluate_mapped, map_file
+
+    if fmt not in WRITERS:
+        raise ValueError(f"unknown output format '{fmt}'")
+
+    writer = WRITERS[fmt](out)
+    stats = StreamStats()
+    if calc_engine is None:
+        calc_engine = Calculate(**(options or {}))
+
+    mapped = map_file(path)
+    if mapped is None:
+        stats.stop()
+        return stats
+    data = memoryview(mapped)
+    try:
+        # Only the CSV writer needs the expression text
+        rows = evaluate_mapped(calc_engine, data, want_text=fmt == "csv")
+        return write_rows(rows, writer, stats, errors)
+    finally:
+        data.release()
+        mapped.close()
+
+
+def write_rows(rows, writer, stats, errors):
+    for line_no, expr, result, error in rows:
+        stats.lines += 1
+        if error is None:
+            try:
+                writer.write(line_no, expr, result, error)
+                continue
+            except (ValueError, OverflowError) as e:
+                # A result that cannot be written fails its own row only
+                result, error = None, e
+        stats.errors += 1
+        if errors is not None:
+            errors.write(f"line {line_no}: Error: {error}\n")
+        writer.write(line_no, expr, result, error)
+
+    stats.stop()
+    return stats
@@ -0,0 +1,174 @@
+import csv
+
+import numpy as np
+
+from engine import PRECEDENCE, is_array
+
+
+# Per-row error codes; 0 means the row has a value. The messages match the
+# errors Calculate raises for the same input.
+DIVISION_BY_ZERO = 1
+DOMAIN_ERROR = 2
+ZERO_POWER = 3
+OUT_OF_RANGE = 4
+
+ERRORS = (
+    None,
+    "division by zero",
+    "math domain error",
+    "0.0 cannot be raised to a negative power",
+    "(34, 'Numerical result out of range')",
+)
+
+
+def flag(codes, mask, code):
+    # Keep the first error hit by each row, as a scalar calculation would
+    codes[mask & (codes == 0)] = code
+
+
+def add(a, b, codes):
+    return np.add(a, b)
+
+
+def sub(a, b, codes):
+    return np.subtract(a, b)
+
+
+def mul(a, b, codes):
+    return np.multiply(a, b)
+
+
+def div(a, b, codes):
+    # Same threshold as Calculate.div, applied to every row
+    flag(codes, np.abs(b) < 1e-15, DIVISION_BY_ZERO)
+    return np.divide(a, b)
+
+
+def pows(a, b, codes):
+    result = np.power(a, b)
+    # Negative base with fractional exponent has no real result
+    flag(codes, (a < 0) & (b != np.floor(b)), DOMAIN_ERROR)
+    flag(codes, (a == 0) & (b < 0), ZERO_POWER)
+    flag(codes, np.isinf(result) & np.isfinite(a) & np.isfinite(b), OUT_OF_RANGE)
+    return result
+
+
+OPERATIONS = {"+": add, "-": sub, "*": mul, "/": div, "^": pows}
+
+
+def parse_range(spec):
+    # (start, step, number of values) of "start:stop:step", stop included
+    try:
+        start, stop, step = (float(part) for part in spec.split(":"))
+    except ValueError:
+        raise ValueError(f"expected start:stop:step, got '{spec}'") from None
+    if not step or (stop - start) / step < 0:
+        raise ValueError(f"step {step:g} does not lead from {start:g} to {stop:g}")
+    return start, step, int(np.floor((stop - start) / step + 1e-9)) + 1
+
+
+def sweep_range(spec, limit=None):
+    # "start:stop:step" with stop included, e.g. "0:1:0.25" -> 0, .25, ... 1;
+    # only the first 'limit' values when given
+    start, step, count = parse_range(spec)
+    if limit is not None:
+        count = min(count, limit)
+    return start + step * np.arange(count)
+
+
+class Sweep:
+    # An expression with one named variable, parsed once and evaluated over
+    # a whole array of values at a time. Arithmetic is always float64.
+    def __init__(self, calc_engine, expr, variable="x"):
+        if not variable.isidentifier() or variable == "ans" or variable in PRECEDENCE:
+            raise ValueError(f"invalid variable name '{variable}'")
+        self.calc_engine = calc_engine
+        self.expr = expr
+        self.variable = variable
+        program = calc_engine.parse(calc_engine.simplify(expr), (variable,))
+        if any(is_array(node) or node == "@" for node in program):
+            raise ValueError("vectors cannot be swept")
+        self.program = [
+            node if node.__class__ is str else float(node) for node in program
+        ]
+
+    def evaluate(self, values):
+        # Returns (results, codes): one float64 result and one error code per
+        # value; rows with an error hold NaN
+        x = np.asarray(values, dtype=np.float64)
+        codes = np.zeros(x.shape, dtype=np.uint8)
+        budget = self.calc_engine.budget
+        deadline = budget.deadline() if budget is not None else None
+        variable = self.variable
+        stack = []
+        ans = None
+
+        with np.errstate(all="ignore"):
+            for node in self.program:
+                if budget is not None:
+                    budget.check_time(deadline)
+                if node.__class__ is not str:
+                    stack.append(node)
+                elif node == variable:
+                    stack.append(x)
+                elif node == "neg":
+                    stack[-1] = np.negative(stack[-1])
+                elif node == "ans":
+                    if ans is None:
+                        ans = self.calc_engine.resolve_ans(float)
+                        if is_array(ans):
+                            raise ValueError("vectors cannot be swept")
+                    stack.append(ans)
+                else:
+                    right = stack.pop()
+                    if node == "^" and budget is not None:
+                        budget.check_exponent(np.max(np.abs(right)))
+                    stack[-1] = OPERATIONS[node](stack[-1], right, codes)
+
+        # A result that does not use the variable is the same for every row
+        results = np.array(np.broadcast_to(stack[0], x.shape), dtype=np.float64)
+        results[codes != 0] = np.nan
+        return results, codes
+
+    def table(self, values):
+        # (value, result, error) rows; result is None where error is set
+        x = np.asarray(values, dtype=np.float64)
+        results, codes = self.evaluate(x)
+        for value, result, code in zip(x.tolist(), results.tolist(), codes.tolist()):
+            if code:
+                yield value, None, ERRORS[code]
+            else:
+                yield value, result, None
+
+
+def cell_text(result, code):
+    return f"Error: {ERRORS[code]}" if code else repr(result)
+
+
+def write_table(sweeps, values, out, fmt="text"):
+    # One row per value and one column per sweep; returns the number of
+    # cells that hold an error. "bin" writes the results row by row as
+    # little-endian float64, with NaN for errors.
+    x = np.asarray(values, dtype=np.float64)
+    columns = [sweep.evaluate(x) for sweep in sweeps]
+    errors = sum(int(np.count_nonzero(codes)) for _, codes in columns)
+
+    if fmt == "bin":
+        table = np.column_stack([results for results, _ in columns])
+        out.write(table.astype("<f8").tobytes())
+        return errors
+
+    header = [sweeps[0].variable if sweeps else "x"]
+    header += [sweep.expr for sweep in sweeps]
+    cells = [zip(results.tolist(), codes.tolist()) for results, codes in columns]
+    if fmt == "csv":
+        writer = csv.writer(out)
+        writer.writerow(header)
+        for value, *row in zip(x.tolist(), *cells):
+            writer.writerow([repr(value)] + [cell_text(*cell) for cell in row])
+    else:
+        out.write("\t".join(header) + "\n")
+        for value, *row in zip(x.tolist(), *cells):
+            out.write("\t".join([repr(value)] + [cell_text(*cell) for cell in row]))
+            out.write("\n")
+    return errors
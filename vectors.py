@@ -0,0 +1,88 @@
+import sys
+
+import numpy as np
+
+import sweep
+from engine import format_result
+
+
+# Exception type for each sweep error code, as a scalar calculation raises it
+EXCEPTIONS = (None, ZeroDivisionError, ValueError, ZeroDivisionError, OverflowError)
+
+# Elements shown before a displayed array is shortened with '...'
+MAX_SHOWN = 1000
+
+
+def array_literal(elements):
+    # Float64 array from nested lists of numbers. It is read-only because it
+    # stays in the parsed program and may be reused by the cache.
+    try:
+        value = np.array(elements, dtype=np.float64)
+    except ValueError:
+        raise ValueError("matrix rows must have the same length") from None
+    value.flags.writeable = False
+    return value
+
+
+def checked(operation, a, b):
+    # Run one of the sweep operations and raise the error of the first
+    # element that has one, so '/' and '^' fail like they do on numbers
+    try:
+        shape = np.broadcast_shapes(np.shape(a), np.shape(b))
+    except ValueError:
+        raise ValueError(
+            f"shapes {np.shape(a)} and {np.shape(b)} do not match"
+        ) from None
+    codes = np.zeros(shape, dtype=np.uint8)
+    with np.errstate(all="ignore"):
+        result = operation(a, b, codes)
+    if codes.any():
+        code = codes[codes != 0][0]
+        raise EXCEPTIONS[code](sweep.ERRORS[code])
+    return result
+
+
+def div(a, b):
+    return checked(sweep.div, a, b)
+
+
+def pows(a, b):
+    return checked(sweep.pows, a, b)
+
+
+def matmul(a, b):
+    try:
+        with np.errstate(all="ignore"):
+            result = np.matmul(a, b)
+    except ValueError:
+        raise ValueError(f"cannot multiply shapes {a.shape} and {b.shape}") from None
+    # Two vectors give their dot product, a plain number
+    return float(result) if result.ndim == 0 else result
+
+
+OPERATIONS = {"/": div, "^": pows, "@": matmul}
+
+
+def element_text(x):
+    try:
+        return format_result(float(x))
+    except OverflowError:
+        return "{:.6e}".format(x)
+
+
+def format_array(value, element=element_text, threshold=MAX_SHOWN):
+    # Literal form such as [[1,2],[3,4]]. Past 'threshold' elements only the
+    # first and last few are formatted, so a large result displays quickly.
+    text = np.array2string(
+        value,
+        max_line_width=sys.maxsize,
+        threshold=threshold,
+        separator=",",
+        formatter={"float_kind": element},
+    )
+    return text.replace("\n", "").replace(" ", "")
+
+
+def array_text(value):
+    # Every element in shortest round-trip form, for output files
+    return format_array(value, lambda x: repr(float(x)), sys.maxsize)